@@ -11,27 +11,57 @@ from werkzeug.security import generate_password_hash, check_password_hash
 # Import from our healthcare modules
 from healthcare_assistant import (
     PatientProfile, HealthAssessment, ConversationManager, 
-    DoctorInterface, DataStorage, PriorityLevel, Symptom
+    DoctorInterface, DataStorage, ShardedDataStorage, PriorityLevel, Symptom
 )
 
 # Import the new ChatGPT integration
-from chatgpt_integration import ChatGPTManager, integrate_with_health_assessment
+from chatgpt_integration import (
+    ChatGPTManager, BackgroundExtractor, build_partial_assessment, integrate_with_health_assessment
+)
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'dev_key_for_hackathon')
 
-# Initialize our data storage
-storage = DataStorage()
+# Initialize our data storage; processed assessments are archived once they
+# are older than the hot retention window. With STORAGE_SHARDS > 1, patients
+# are spread across that many shard files.
+HOT_RETENTION_DAYS = int(os.environ.get('HOT_RETENTION_DAYS', 30))
+STORAGE_SHARDS = int(os.environ.get('STORAGE_SHARDS', 1))
+if STORAGE_SHARDS > 1:
+    storage = ShardedDataStorage(shard_count=STORAGE_SHARDS, hot_retention_days=HOT_RETENTION_DAYS)
+else:
+    storage = DataStorage(hot_retention_days=HOT_RETENTION_DAYS)
+ARCHIVE_INTERVAL_SECONDS = float(os.environ.get('ARCHIVE_INTERVAL_SECONDS', 3600))
 doctor_interface = DoctorInterface()
 
+@app.before_request
+def start_archival():
+    # Started by the first request rather than at import, so only the process
+    # serving requests archives; the debug reloader's watcher process also
+    # imports this module and would otherwise overwrite the data file with
+    # its stale copy
+    storage.start_archival(interval_seconds=ARCHIVE_INTERVAL_SECONDS)
+
 # Initialize ChatGPT API with your key
 OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY', '')
 OPENAI_ORG_ID = os.environ.get('OPENAI_ORG_ID', '')
 
-# Load any existing assessments into the doctor's queue
-for assessment in storage.assessments.values():
+# Load any unprocessed assessments into the doctor's queue
+for assessment in storage.get_open_assessments():
     doctor_interface.add_assessment(assessment)
 
+def publish_partial_assessment(assessment_id, patient_id, medical_data):
+    """Show an in-progress conversation in the doctor's queue as extraction catches up"""
+    partial = build_partial_assessment(extractor.manager, assessment_id, patient_id, medical_data)
+    doctor_interface.update_in_progress(partial)
+
+# Extract structured data in the background while conversations are ongoing;
+# conversations abandoned without logging out drop out of the doctor's queue
+# after CONVERSATION_IDLE_SECONDS
+extractor = BackgroundExtractor(OPENAI_API_KEY, OPENAI_ORG_ID, on_update=publish_partial_assessment,
+                                idle_timeout=float(os.environ.get('CONVERSATION_IDLE_SECONDS', 3600)),
+                                on_expire=doctor_interface.remove_in_progress)
+
 # Simple user authentication (for demo purposes only)
 users = {
     "doctor": {
@@ -69,6 +99,9 @@ def login():
 
 @app.route('/logout')
 def logout():
+    if 'assessment_id' in session:
+        extractor.discard(session['assessment_id'])
+        doctor_interface.remove_in_progress(session['assessment_id'])
     session.pop('username', None)
     session.pop('role', None)
     session.pop('patient_id', None)
@@ -83,7 +116,7 @@ def patient_chat():
     # For demo, assign a patient ID if none exists
     if 'patient_id' not in session:
         # Check if we have a profile for this username
-        existing_patients = [p for p in storage.patients.values() if p.name == session['username']]
+        existing_patients = [p for p in storage.get_patients() if p.name == session['username']]
         
         if existing_patients:
             session['patient_id'] = existing_patients[0].patient_id
@@ -154,11 +187,15 @@ def patient_message():
                 if 'assessment_id' in session:
                     health_assessment.assessment_id = session['assessment_id']
                 
-                # Fill assessment with data from ChatGPT
-                integrate_with_health_assessment(chatgpt_manager, health_assessment, storage)
-                
-                # Save the assessment
-                storage.add_assessment(health_assessment)
+                # Fill assessment with data from ChatGPT (only the messages the
+                # background extractor hasn't seen yet), then save it together
+                # with the updated patient profile in a single write
+                patient = integrate_with_health_assessment(chatgpt_manager, health_assessment, storage,
+                                                           extractor, save_patient=False)
+                with storage.batch():
+                    if patient:
+                        storage.add_patient(patient)
+                    storage.add_assessment(health_assessment)
                 doctor_interface.add_assessment(health_assessment)
                 
                 # Add concluding message
@@ -173,6 +210,11 @@ def patient_message():
                     "response": response,
                     "conversation_completed": True
                 })
+            
+            # Extract this turn in the background
+            if 'assessment_id' in session:
+                extractor.schedule(session['assessment_id'], chatgpt_manager.conversation_history,
+                                   session['patient_id'])
                 
         except Exception as e:
             print(f"Error processing message: {e}")
@@ -195,7 +237,8 @@ def doctor_queue():
     if 'username' not in session or session['role'] != 'doctor':
         return jsonify({"error": "Unauthorized"}), 401
     
-    queue = doctor_interface.get_patient_queue()
+    extractor.expire_idle()
+    queue = doctor_interface.get_patient_queue(include_in_progress=True)
     
     # Enhance queue data with patient names
     for item in queue:
@@ -222,8 +265,64 @@ def get_assessment(assessment_id):
     if patient:
         details['patient'] = patient.to_dict()
     
+    # Add the patient's symptom and priority history
+    details['patient_timeline'] = storage.get_patient_timeline(details['patient_id'])
+    
     return jsonify(details)
 
+@app.route('/api/doctor/patient/<patient_id>/timeline')
+def get_patient_timeline(patient_id):
+    if 'username' not in session or session['role'] != 'doctor':
+        return jsonify({"error": "Unauthorized"}), 401
+    
+    patient = storage.get_patient(patient_id)
+    if not patient:
+        return jsonify({"error": "Patient not found"}), 404
+    
+    timeline = storage.get_patient_timeline(patient_id)
+    timeline['patient_name'] = patient.name
+    
+    return jsonify(timeline)
+
+@app.route('/api/doctor/search')
+def search_assessments():
+    if 'username' not in session or session['role'] != 'doctor':
+        return jsonify({"error": "Unauthorized"}), 401
+    
+    try:
+        limit = int(request.args.get('limit', 20))
+    except ValueError:
+        return jsonify({"error": "limit must be a number"}), 400
+    if limit < 1:
+        return jsonify({"error": "limit must be at least 1"}), 400
+    limit = min(limit, 100)
+    
+    results = storage.search_assessments(
+        query=request.args.get('q', ''),
+        priority_level=request.args.get('priority'),
+        patient_id=request.args.get('patient_id'),
+        condition=request.args.get('condition'),
+        probability=request.args.get('probability'),
+        limit=limit
+    )
+    
+    response = []
+    for assessment, score in results:
+        patient = storage.get_patient(assessment.patient_id)
+        response.append({
+            "assessment_id": assessment.assessment_id,
+            "patient_id": assessment.patient_id,
+            "patient_name": patient.name if patient else "Unknown Patient",
+            "priority_level": assessment.priority_level.value,
+            "priority_score": assessment.priority_score,
+            "submission_time": assessment.assessment_date.isoformat(),
+            "symptoms": [s.name for s in assessment.symptoms],
+            "condition_predictions": assessment.condition_predictions,
+            "score": score
+        })
+    
+    return jsonify(response)
+
 @app.route('/api/doctor/process', methods=['POST'])
 def process_assessment():
     if 'username' not in session or session['role'] != 'doctor':
@@ -241,6 +340,7 @@ def process_assessment():
     )
     
     if success:
+        storage.mark_processed(assessment_id, doctor_notes)
         return jsonify({"status": "success"})
     else:
         return jsonify({"error": "Assessment not found"}), 404
@@ -1,11 +1,22 @@
 # Healthcare Conversation Assistant
 # A modular implementation for the medical triage and symptom tracking system
 
+import bisect
+import copy
+import hashlib
 import json
+import math
+import os
+import re
 import datetime
+import gzip
+import stat
+import threading
 import uuid
+from collections import ChainMap, OrderedDict
+from contextlib import ExitStack, contextmanager
 from enum import Enum
-from typing import Dict, List, Optional, Tuple, Any
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Any, Union
 
 # ============ CORE DATA MODELS ============
 
@@ -95,6 +106,8 @@ class HealthAssessment:
         self.priority_level: PriorityLevel = PriorityLevel.ROUTINE
         self.recommendation: str = ""
         self.condition_predictions: List[Dict] = []  # New field for predictions
+        self.processed_at: Optional[datetime.datetime] = None  # Set once a doctor has reviewed it
+        self.doctor_notes: str = ""
     
     def add_symptom(self, symptom: Symptom):
         self.symptoms.append(symptom)
@@ -151,7 +164,9 @@ class HealthAssessment:
             "priority_score": self.priority_score,
             "priority_level": self.priority_level.value,
             "recommendation": self.recommendation,
-            "condition_predictions": self.condition_predictions  # Include predictions in dict
+            "condition_predictions": self.condition_predictions,  # Include predictions in dict
+            "processed_at": self.processed_at.isoformat() if self.processed_at else None,
+            "doctor_notes": self.doctor_notes
         }
     
     @classmethod
@@ -169,6 +184,10 @@ class HealthAssessment:
             assessment.condition_predictions = data["condition_predictions"]
         else:
             assessment.condition_predictions = []
+        
+        if data.get("processed_at"):
+            assessment.processed_at = datetime.datetime.fromisoformat(data["processed_at"])
+        assessment.doctor_notes = data.get("doctor_notes", "")
             
         return assessment
     
@@ -381,31 +400,62 @@ class ConversationManager:
 class DoctorInterface:
     def __init__(self):
         self.patient_queue: List[HealthAssessment] = []
+        # Provisional assessments for conversations still in progress
+        self.in_progress: Dict[str, HealthAssessment] = {}
     
     def add_assessment(self, assessment: HealthAssessment):
         """Add a new assessment to the doctor's queue"""
+        self.in_progress.pop(assessment.assessment_id, None)
         self.patient_queue.append(assessment)
         # Sort queue by priority score (highest first)
         self.patient_queue.sort(key=lambda a: a.priority_score, reverse=True)
     
-    def get_patient_queue(self) -> List[Dict]:
+    def update_in_progress(self, assessment: HealthAssessment):
+        """Add or refresh the provisional assessment for an ongoing conversation"""
+        self.in_progress[assessment.assessment_id] = assessment
+    
+    def remove_in_progress(self, assessment_id: str):
+        """Drop the provisional assessment for an abandoned conversation"""
+        self.in_progress.pop(assessment_id, None)
+    
+    def get_patient_queue(self, include_in_progress: bool = False) -> List[Dict]:
         """Get the current prioritized patient queue"""
-        return [
+        queue = [
             {
                 "assessment_id": assessment.assessment_id,
                 "patient_id": assessment.patient_id,
                 "priority_level": assessment.priority_level.value,
                 "priority_score": assessment.priority_score,
-                "submission_time": assessment.assessment_date.isoformat()
+                "submission_time": assessment.assessment_date.isoformat(),
+                "in_progress": False
             }
             for assessment in self.patient_queue
         ]
+        if include_in_progress:
+            queue.extend(
+                {
+                    "assessment_id": assessment.assessment_id,
+                    "patient_id": assessment.patient_id,
+                    "priority_level": assessment.priority_level.value,
+                    "priority_score": assessment.priority_score,
+                    "submission_time": assessment.assessment_date.isoformat(),
+                    "in_progress": True
+                }
+                for assessment in sorted(list(self.in_progress.values()),
+                                         key=lambda a: a.priority_score, reverse=True)
+            )
+        return queue
     
     def get_assessment_details(self, assessment_id: str) -> Optional[Dict]:
         """Get detailed view of a specific assessment"""
         for assessment in self.patient_queue:
             if assessment.assessment_id == assessment_id:
                 return assessment.to_dict()
+        assessment = self.in_progress.get(assessment_id)
+        if assessment:
+            details = assessment.to_dict()
+            details["in_progress"] = True
+            return details
         return None
     
     def process_assessment(self, assessment_id: str, doctor_notes: str, schedule_appointment: bool) -> bool:
@@ -418,13 +468,375 @@ class DoctorInterface:
                 return True
         return False
 
+# ============ PATIENT TIMELINES ============
+
+class PatientTimeline:
+    """
+    Materialized per-patient history of symptoms and priority scores.
+    
+    Updated one assessment at a time via `record()` so doctors can see how
+    a returning patient is trending without rescanning every assessment.
+    """
+    def __init__(self, patient_id: str):
+        self.patient_id = patient_id
+        self.assessment_ids: set = set()
+        self.symptom_occurrences: Dict[str, Dict] = {}  # keyed by lower-cased symptom name
+        self.severity_trend: List[Dict] = []  # one point per assessment, oldest first
+        self.priority_history: List[Dict] = []  # one entry per assessment, oldest first
+        self.last_seen: Optional[datetime.datetime] = None
+    
+    def record(self, assessment: HealthAssessment):
+        """Fold a new assessment into the aggregates"""
+        if assessment.assessment_id in self.assessment_ids:
+            return
+        self.assessment_ids.add(assessment.assessment_id)
+        date = assessment.assessment_date
+        
+        if self.last_seen is None or date > self.last_seen:
+            self.last_seen = date
+        
+        # An assessment counts once per symptom, even if the symptom was
+        # reported more than once; its most severe report is kept
+        by_key: Dict[str, Symptom] = {}
+        for symptom in assessment.symptoms:
+            key = symptom.name.strip().lower()
+            if key not in by_key or symptom.severity > by_key[key].severity:
+                by_key[key] = symptom
+        
+        for key, symptom in by_key.items():
+            occurrence = self.symptom_occurrences.get(key)
+            if occurrence is None:
+                occurrence = {
+                    "name": symptom.name,
+                    "count": 0,
+                    "first_seen": date,
+                    "last_seen": date,
+                    "severities": []
+                }
+                self.symptom_occurrences[key] = occurrence
+            occurrence["count"] += 1
+            occurrence["first_seen"] = min(occurrence["first_seen"], date)
+            occurrence["last_seen"] = max(occurrence["last_seen"], date)
+            self._insert_by_date(occurrence["severities"], {
+                "date": date,
+                "assessment_id": assessment.assessment_id,
+                "severity": symptom.severity,
+                "duration_days": symptom.duration_days
+            })
+        
+        if assessment.symptoms:
+            severities = [s.severity for s in assessment.symptoms]
+            self._insert_by_date(self.severity_trend, {
+                "date": date,
+                "assessment_id": assessment.assessment_id,
+                "average_severity": round(sum(severities) / len(severities), 1),
+                "max_severity": max(severities)
+            })
+        
+        self._insert_by_date(self.priority_history, {
+            "date": date,
+            "assessment_id": assessment.assessment_id,
+            "priority_score": assessment.priority_score,
+            "priority_level": assessment.priority_level.value
+        })
+    
+    @staticmethod
+    def _insert_by_date(entries: List[Dict], entry: Dict):
+        # Assessments normally arrive in date order, so this is an append;
+        # bulk imports may deliver them out of order
+        if not entries or entries[-1]["date"] <= entry["date"]:
+            entries.append(entry)
+        else:
+            bisect.insort(entries, entry, key=lambda e: e["date"])
+    
+    @classmethod
+    def from_assessments(cls, patient_id: str, assessments: Iterable[HealthAssessment]) -> 'PatientTimeline':
+        timeline = cls(patient_id)
+        for assessment in assessments:
+            timeline.record(assessment)
+        return timeline
+    
+    def to_dict(self) -> Dict:
+        def with_iso_date(entry: Dict) -> Dict:
+            return {**entry, "date": entry["date"].isoformat()}
+        
+        return {
+            "patient_id": self.patient_id,
+            "assessment_ids": sorted(self.assessment_ids),
+            "assessment_count": len(self.assessment_ids),
+            "last_seen": self.last_seen.isoformat() if self.last_seen else None,
+            "symptom_occurrences": [
+                {
+                    "name": o["name"],
+                    "count": o["count"],
+                    "first_seen": o["first_seen"].isoformat(),
+                    "last_seen": o["last_seen"].isoformat(),
+                    "severities": [with_iso_date(e) for e in o["severities"]]
+                }
+                for o in sorted(self.symptom_occurrences.values(), key=lambda o: o["last_seen"], reverse=True)
+            ],
+            "severity_trend": [with_iso_date(e) for e in self.severity_trend],
+            "priority_history": [with_iso_date(e) for e in self.priority_history]
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'PatientTimeline':
+        def with_date(entry: Dict) -> Dict:
+            return {**entry, "date": datetime.datetime.fromisoformat(entry["date"])}
+        
+        timeline = cls(data["patient_id"])
+        timeline.assessment_ids = set(data.get("assessment_ids", []))
+        if data.get("last_seen"):
+            timeline.last_seen = datetime.datetime.fromisoformat(data["last_seen"])
+        for occurrence in data.get("symptom_occurrences", []):
+            timeline.symptom_occurrences[occurrence["name"].strip().lower()] = {
+                "name": occurrence["name"],
+                "count": occurrence["count"],
+                "first_seen": datetime.datetime.fromisoformat(occurrence["first_seen"]),
+                "last_seen": datetime.datetime.fromisoformat(occurrence["last_seen"]),
+                "severities": [with_date(e) for e in occurrence["severities"]]
+            }
+        timeline.severity_trend = [with_date(e) for e in data.get("severity_trend", [])]
+        timeline.priority_history = [with_date(e) for e in data.get("priority_history", [])]
+        return timeline
+
+# ============ SEARCH INDEX ============
+
+class AssessmentSearchIndex:
+    """
+    In-process inverted index over assessment content.
+    
+    Indexes symptom names and descriptions, recommendations, predicted
+    conditions and recommended tests. Assessments are added one at a time
+    as they are stored, and queries only touch the postings for their terms.
+    """
+    # Matches in these fields count for more than free-text mentions
+    FIELD_WEIGHTS = {
+        "symptom": 3.0,
+        "condition": 3.0,
+        "test": 1.5,
+        "description": 1.0,
+        "recommendation": 1.0
+    }
+    STOP_WORDS = {"a", "an", "and", "the", "of", "in", "on", "or", "to", "with", "for", "is", "at", "by"}
+    
+    def __init__(self):
+        self.postings: Dict[str, Dict[str, float]] = {}  # term -> {assessment_id: weighted term frequency}
+        self.documents: Dict[str, Dict] = {}  # assessment_id -> filter metadata and indexed terms
+    
+    @classmethod
+    def tokenize(cls, text: str) -> List[str]:
+        return [t for t in re.findall(r"[a-z0-9]+", str(text).lower()) if t not in cls.STOP_WORDS]
+    
+    def _weighted_terms(self, assessment: HealthAssessment) -> Dict[str, float]:
+        fields: List[Tuple[str, Any]] = []
+        for symptom in assessment.symptoms:
+            fields.append(("symptom", symptom.name))
+            fields.append(("description", symptom.description))
+        fields.append(("recommendation", assessment.recommendation))
+        for prediction in assessment.condition_predictions:
+            if not isinstance(prediction, dict):
+                continue
+            fields.append(("condition", prediction.get("condition", "")))
+            tests = prediction.get("recommended_tests") or []
+            if isinstance(tests, list):
+                fields.extend(("test", test) for test in tests)
+        
+        weights: Dict[str, float] = {}
+        for field, text in fields:
+            for term in self.tokenize(text or ""):
+                weights[term] = weights.get(term, 0.0) + self.FIELD_WEIGHTS[field]
+        return weights
+    
+    def add(self, assessment: HealthAssessment):
+        """Index an assessment, replacing any earlier version of it"""
+        self.remove(assessment.assessment_id)
+        
+        weights = self._weighted_terms(assessment)
+        for term, weight in weights.items():
+            self.postings.setdefault(term, {})[assessment.assessment_id] = weight
+        
+        self.documents[assessment.assessment_id] = {
+            "patient_id": assessment.patient_id,
+            "priority_level": assessment.priority_level.value,
+            "assessment_date": assessment.assessment_date.isoformat(),
+            "conditions": {
+                str(p.get("condition", "")).lower(): str(p.get("probability_range", "")).lower()
+                for p in assessment.condition_predictions if isinstance(p, dict)
+            },
+            "terms": list(weights),
+            "length": sum(weights.values())
+        }
+    
+    def remove(self, assessment_id: str):
+        """Drop an assessment from the index"""
+        document = self.documents.pop(assessment_id, None)
+        if document is None:
+            return
+        for term in document["terms"]:
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(assessment_id, None)
+                if not postings:
+                    del self.postings[term]
+    
+    def update(self, other: 'AssessmentSearchIndex', assessment_ids: Optional[Iterable[str]] = None):
+        """Copy documents (only `assessment_ids`, if given) from another index,
+        replacing any earlier versions of them"""
+        for assessment_id in (list(other.documents) if assessment_ids is None else assessment_ids):
+            document = other.documents.get(assessment_id)
+            if document is None:
+                continue
+            self.remove(assessment_id)
+            for term in document["terms"]:
+                self.postings.setdefault(term, {})[assessment_id] = other.postings[term][assessment_id]
+            self.documents[assessment_id] = document
+    
+    def _matches_filters(self, document: Dict, priority_level: Optional[str], patient_id: Optional[str],
+                         condition: Optional[str], probability: Optional[str]) -> bool:
+        if priority_level and document["priority_level"] != priority_level.lower():
+            return False
+        if patient_id and document["patient_id"] != patient_id:
+            return False
+        if condition or probability:
+            condition = (condition or "").lower()
+            probability = (probability or "").lower()
+            return any(
+                condition in name and (not probability or prob == probability)
+                for name, prob in document["conditions"].items()
+            )
+        return True
+    
+    def term_statistics(self, query: str) -> Tuple[int, Dict[str, int]]:
+        """Number of indexed assessments and the document frequency of each term of `query`"""
+        terms = dict.fromkeys(self.tokenize(query))
+        return len(self.documents), {term: len(self.postings.get(term, {})) for term in terms}
+    
+    def search(self, query: str = "", priority_level: Optional[str] = None, patient_id: Optional[str] = None,
+               condition: Optional[str] = None, probability: Optional[str] = None,
+               limit: int = 20, corpus_size: Optional[int] = None,
+               document_frequencies: Optional[Dict[str, int]] = None) -> List[Tuple[str, float]]:
+        """
+        Find assessments containing every term of `query`, ranked by tf-idf.
+        
+        Args:
+            query: Free text; all (non stop-word) terms must match
+            priority_level: Only return assessments at this priority level
+            patient_id: Only return this patient's assessments
+            condition: Only return assessments with a predicted condition containing this text
+            probability: Only return assessments with a prediction at this probability range
+                (combined with `condition` when both are given)
+            limit: Maximum number of results
+            corpus_size: Total assessments to compute idf against, instead of
+                this index's own count
+            document_frequencies: Per-term document counts to compute idf
+                against; with `corpus_size`, makes scores comparable across
+                indexes that each hold part of one corpus
+            
+        Returns:
+            List of (assessment_id, score) tuples, best match first
+        """
+        terms = list(dict.fromkeys(self.tokenize(query)))
+        
+        if not terms:
+            # Filter-only query: newest first
+            candidates = [
+                (assessment_id, 0.0) for assessment_id, document in self.documents.items()
+                if self._matches_filters(document, priority_level, patient_id, condition, probability)
+            ]
+            candidates.sort(key=lambda c: self.documents[c[0]]["assessment_date"], reverse=True)
+            return candidates[:limit]
+        
+        postings = {term: self.postings.get(term, {}) for term in terms}
+        if not all(postings.values()):
+            return []
+        
+        # Intersect starting from the rarest term
+        ordered = sorted(postings.values(), key=len)
+        candidate_ids = set(ordered[0])
+        for term_postings in ordered[1:]:
+            candidate_ids.intersection_update(term_postings)
+            if not candidate_ids:
+                return []
+        
+        total = corpus_size or len(self.documents)
+        frequencies = document_frequencies or {}
+        idf = {
+            term: math.log(1 + total / (frequencies.get(term) or len(term_postings)))
+            for term, term_postings in postings.items()
+        }
+        results = []
+        for assessment_id in candidate_ids:
+            document = self.documents[assessment_id]
+            if not self._matches_filters(document, priority_level, patient_id, condition, probability):
+                continue
+            score = sum(postings[term][assessment_id] * idf[term] for term in terms)
+            results.append((assessment_id, round(score / math.sqrt(document["length"] or 1), 4)))
+        
+        results.sort(key=lambda r: r[1], reverse=True)
+        return results[:limit]
+    
+    def to_dict(self) -> Dict:
+        return {
+            "postings": self.postings,
+            "documents": self.documents
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'AssessmentSearchIndex':
+        index = cls()
+        index.postings = data.get("postings", {})
+        index.documents = data.get("documents", {})
+        return index
+
 # ============ DATA STORAGE ============
 
 class DataStorage:
-    def __init__(self, storage_file: str = "healthcare_data.json"):
+    # Number of decompressed archive segments kept in memory
+    SEGMENT_CACHE_SIZE = 8
+    
+    def __init__(self, storage_file: str = "healthcare_data.json", hot_retention_days: int = 30,
+                 archive_dir: Optional[str] = None):
+        """
+        Args:
+            storage_file: JSON file holding patients and hot (open or recent) assessments
+            hot_retention_days: Days a processed assessment stays in memory before
+                it is moved to the archive
+            archive_dir: Directory for compressed archive segments
+                (defaults to "<storage file>_archive")
+        """
         self.storage_file = storage_file
         self.patients: Dict[str, PatientProfile] = {}
-        self.assessments: Dict[str, HealthAssessment] = {}
+        self.assessments: Dict[str, HealthAssessment] = {}  # hot tier
+        self._hot_by_patient: Dict[str, Set[str]] = {}
+        # Per-patient timelines over both tiers, materialized on first use
+        self.timelines: Dict[str, PatientTimeline] = {}
+        self.search_index = AssessmentSearchIndex()  # hot tier only
+        # Sidecar file holding the persisted hot search index
+        self.index_file = os.path.splitext(storage_file)[0] + ".index.json"
+        self._generation: Optional[str] = None
+        
+        # Cold tier: archived assessments live in immutable gzip segments,
+        # each with an immutable search index file next to it, located
+        # through the manifest and loaded on demand
+        self.hot_retention_days = hot_retention_days
+        self.archive_dir = archive_dir or os.path.splitext(storage_file)[0] + "_archive"
+        self.manifest_file = os.path.join(self.archive_dir, "manifest.json.gz")
+        self.cold_assessments: Dict[str, Dict] = {}  # assessment_id -> segment, patient_id, assessment_date
+        self._cold_by_patient: Dict[str, List[str]] = {}
+        # Views over the archive alone, built from the segments on first use
+        self._cold_search_index: Optional[AssessmentSearchIndex] = None
+        self.cold_timelines: Dict[str, PatientTimeline] = {}
+        self._segment_cache: 'OrderedDict[str, Dict[str, HealthAssessment]]' = OrderedDict()
+        # Segments that may hold records no longer in the archive; see compact_archive()
+        self._stale_segments: Set[str] = set()
+        self._manifest_dirty = False
+        self._archival_stop: Optional[threading.Event] = None
+        
+        # Guards in-memory state and writes; held for the whole of a batch
+        self._lock = threading.RLock()
+        # Batch depth/dirty flag/snapshot of the thread that holds the lock
+        self._batch_state = threading.local()
         self.try_load_data()
     
     def try_load_data(self):
@@ -432,6 +844,7 @@ class DataStorage:
         try:
             with open(self.storage_file, 'r') as f:
                 data = json.load(f)
+                self._generation = data.get("generation")
                 
                 # Load patient profiles
                 for patient_data in data.get("patients", []):
@@ -446,38 +859,1070 @@ class DataStorage:
         except (FileNotFoundError, json.JSONDecodeError):
             # If file doesn't exist or is invalid, start with empty data
             pass
+        
+        self._rebuild_hot_by_patient()
+        self._load_manifest()
+        
+        if not self._try_load_index():
+            self._rebuild_derived_data(include_cold=False)
+    
+    def _load_manifest(self):
+        """
+        Load the locations of archived assessments
+        
+        The manifest only maps each archived assessment to its segment,
+        patient and date. It is read whole at startup and rewritten whole
+        whenever assessments enter or leave the archive, which stays cheap
+        because it holds no assessment content. The archive's search index
+        and timelines are built from the segments when first needed.
+        """
+        try:
+            with gzip.open(self.manifest_file, 'rt', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, OSError, json.JSONDecodeError):
+            data = {}
+        
+        for assessment_id, entry in data.get("assessments", {}).items():
+            self.cold_assessments[assessment_id] = entry
+            self._cold_by_patient.setdefault(entry["patient_id"], []).append(assessment_id)
+        
+        # Interrupted archival: the hot copy is authoritative
+        for assessment_id in [a for a in self.cold_assessments if a in self.assessments]:
+            self._forget_cold(assessment_id)
+    
+    def _save_manifest(self):
+        os.makedirs(self.archive_dir, exist_ok=True)
+        self._atomic_write_json(self.manifest_file, {"assessments": self.cold_assessments},
+                                indent=None, compress=True)
+        self._manifest_dirty = False
+    
+    def _try_load_index(self) -> bool:
+        """Load the persisted hot search index if it was written with the current data file"""
+        if self._generation is None:
+            return False
+        try:
+            with open(self.index_file, 'r') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return False
+        if data.get("generation") != self._generation:
+            return False
+        self.search_index = AssessmentSearchIndex.from_dict(data)
+        return True
+    
+    def _rebuild_derived_data(self, include_cold: bool = True):
+        """Recompute the hot search index and drop the timelines (and the
+        archive's views, if `include_cold` is set) so they are rebuilt on use"""
+        if include_cold:
+            self._cold_search_index = None
+            self.cold_timelines = {}
+        self.search_index = AssessmentSearchIndex()
+        for assessment in self.assessments.values():
+            self.search_index.add(assessment)
+        self.timelines = {}
+    
+    def _rebuild_hot_by_patient(self):
+        self._hot_by_patient = {}
+        for assessment in self.assessments.values():
+            self._hot_by_patient.setdefault(assessment.patient_id, set()).add(assessment.assessment_id)
+    
+    def _add_hot(self, assessment: HealthAssessment):
+        if assessment.assessment_id in self.assessments:
+            self._remove_hot(assessment.assessment_id)
+        self.assessments[assessment.assessment_id] = assessment
+        self._hot_by_patient.setdefault(assessment.patient_id, set()).add(assessment.assessment_id)
+    
+    def _remove_hot(self, assessment_id: str):
+        assessment = self.assessments.pop(assessment_id)
+        patient_ids = self._hot_by_patient.get(assessment.patient_id)
+        if patient_ids is not None:
+            patient_ids.discard(assessment_id)
+            if not patient_ids:
+                del self._hot_by_patient[assessment.patient_id]
+    
+    def _hot_patient_assessments(self, patient_id: str) -> List[HealthAssessment]:
+        return [self.assessments[assessment_id] for assessment_id in self._hot_by_patient.get(patient_id, ())]
+    
+    def _cold_index(self) -> AssessmentSearchIndex:
+        """The archive's search index, merged from the per-segment indexes on first use"""
+        if self._cold_search_index is None:
+            by_segment: Dict[str, List[str]] = {}
+            for assessment_id, entry in self.cold_assessments.items():
+                by_segment.setdefault(entry["segment"], []).append(assessment_id)
+            index = AssessmentSearchIndex()
+            for segment, assessment_ids in sorted(by_segment.items()):
+                # A segment may also hold copies that have since left the archive
+                index.update(self._load_segment_index(segment), assessment_ids)
+            self._cold_search_index = index
+        return self._cold_search_index
+    
+    def _cold_timeline(self, patient_id: str) -> Optional[PatientTimeline]:
+        """The patient's timeline over the archive alone, built from the segments on first use"""
+        timeline = self.cold_timelines.get(patient_id)
+        if timeline is None:
+            cold = [self._get_cold_assessment(assessment_id)
+                    for assessment_id in self._cold_by_patient.get(patient_id, [])]
+            cold = [a for a in cold if a is not None]
+            if not cold:
+                return None
+            timeline = self.cold_timelines[patient_id] = PatientTimeline.from_assessments(patient_id, cold)
+        return timeline
+    
+    def _patient_timeline(self, patient_id: str) -> Optional[PatientTimeline]:
+        """The patient's timeline over both tiers, materialized on first use"""
+        timeline = self.timelines.get(patient_id)
+        if timeline is None:
+            cold = self._cold_timeline(patient_id)
+            timeline = copy.deepcopy(cold) if cold else PatientTimeline(patient_id)
+            for assessment in self._hot_patient_assessments(patient_id):
+                timeline.record(assessment)
+            if not timeline.assessment_ids:
+                return None
+            self.timelines[patient_id] = timeline
+        return timeline
+    
+    def _index_assessment(self, assessment: HealthAssessment, replaced_patient_id: Optional[str] = None):
+        """Update the materialized views for a newly stored assessment
+        (`replaced_patient_id` is the owner of the version it replaces, if any)"""
+        self.search_index.add(assessment)
+        
+        if replaced_patient_id is not None:
+            # Replacing an existing assessment can't be folded in incrementally;
+            # the affected timelines are rebuilt when next read
+            for patient_id in {replaced_patient_id, assessment.patient_id}:
+                self.timelines.pop(patient_id, None)
+        else:
+            timeline = self.timelines.get(assessment.patient_id)
+            if timeline is not None:
+                timeline.record(assessment)
     
     def save_data(self):
         """Save current data to storage file"""
-        data = {
-            "patients": [p.to_dict() for p in self.patients.values()],
-            "assessments": [a.to_dict() for a in self.assessments.values()]
+        with self._lock:
+            # The generation ties the index sidecar to this exact data file;
+            # a mismatch on load (e.g. a crash between the two writes) triggers a rebuild.
+            # Only the hot tier is written here; the archive's views go with the manifest
+            self._generation = str(uuid.uuid4())
+            data = {
+                "generation": self._generation,
+                "patients": [p.to_dict() for p in self.patients.values()],
+                "assessments": [a.to_dict() for a in self.assessments.values()]
+            }
+            self._atomic_write_json(self.storage_file, data)
+            
+            index_data = self.search_index.to_dict()
+            index_data["generation"] = self._generation
+            self._atomic_write_json(self.index_file, index_data, indent=None)
+            
+            # Written after the data file, so a crash in between leaves the
+            # assessment in both tiers rather than in neither
+            if self._manifest_dirty:
+                self._save_manifest()
+    
+    @staticmethod
+    def _atomic_write_json(path: str, data: Any, indent: Optional[int] = 2, compress: bool = False):
+        """Write JSON to a temp file next to `path` and rename it into place,
+        so readers never observe a half-written file"""
+        content = json.dumps(data, indent=indent).encode('utf-8')
+        if compress:
+            content = gzip.compress(content)
+        # Replacing a file keeps its mode; new files get the umask default,
+        # which os.open applies to the 0o666 we ask for
+        try:
+            existing_mode: Optional[int] = stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            existing_mode = None
+        directory = os.path.dirname(os.path.abspath(path))
+        tmp_path = os.path.join(directory, f".tmp-{uuid.uuid4().hex}")
+        fd = os.open(tmp_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                if existing_mode is not None:
+                    os.fchmod(f.fileno(), existing_mode)
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    
+    def _commit(self):
+        """Persist a mutation now, or defer it to the end of this thread's open batch"""
+        if getattr(self._batch_state, "depth", 0):
+            self._batch_state.dirty = True
+        else:
+            self.save_data()
+    
+    @contextmanager
+    def batch(self):
+        """
+        Group several mutations into a single durable write.
+        
+        Usage:
+            with storage.batch():
+                storage.add_patient(patient)
+                storage.add_assessment(assessment)
+        
+        The storage lock is held for the whole block, so writes from other
+        threads wait for it instead of being deferred into (or rolled back
+        with) this batch. Keep the block short and avoid slow I/O inside it.
+        
+        Batches may be nested; only the outermost one writes. If the block
+        raises, patients/assessments added, replaced or removed inside it are
+        restored and nothing is written. In-place edits to objects that were
+        already stored are not rolled back.
+        """
+        with self._lock:
+            state = self._batch_state
+            outermost = getattr(state, "depth", 0) == 0
+            if outermost:
+                state.dirty = False
+                state.snapshot = (dict(self.patients), dict(self.assessments), dict(self.cold_assessments))
+            state.depth = getattr(state, "depth", 0) + 1
+            try:
+                yield self
+            except BaseException:
+                state.depth -= 1
+                if outermost:
+                    cold_changed = self.cold_assessments != state.snapshot[2]
+                    if cold_changed:
+                        # Segments written inside the block are no longer referenced
+                        self._stale_segments |= ({e["segment"] for e in self.cold_assessments.values()}
+                                                 - {e["segment"] for e in state.snapshot[2].values()})
+                    self.patients, self.assessments, self.cold_assessments = state.snapshot
+                    state.snapshot = None
+                    self._rebuild_hot_by_patient()
+                    self._cold_by_patient = {}
+                    for assessment_id, entry in self.cold_assessments.items():
+                        self._cold_by_patient.setdefault(entry["patient_id"], []).append(assessment_id)
+                    state.dirty = False
+                    if cold_changed:
+                        self._manifest_dirty = True
+                    self._rebuild_derived_data(include_cold=cold_changed)
+                raise
+            state.depth -= 1
+            if outermost:
+                state.snapshot = None
+                if state.dirty:
+                    state.dirty = False
+                    self.save_data()
+    
+    def bulk_import(self, patients: Iterable[Union[PatientProfile, Dict]] = (),
+                    assessments: Iterable[Union[HealthAssessment, Dict]] = ()) -> Dict[str, int]:
+        """
+        Import many patients and assessments with a single commit.
+        
+        Records may be model objects or their `to_dict()` form.
+        
+        Returns:
+            Counts of imported patients and assessments
+        """
+        counts = {"patients": 0, "assessments": 0}
+        with self.batch():
+            for patient in patients:
+                if isinstance(patient, dict):
+                    patient = PatientProfile.from_dict(patient)
+                self.add_patient(patient)
+                counts["patients"] += 1
+            for assessment in assessments:
+                if isinstance(assessment, dict):
+                    assessment = HealthAssessment.from_dict(assessment)
+                self.add_assessment(assessment)
+                counts["assessments"] += 1
+        return counts
+    
+    def add_patient(self, patient: PatientProfile):
+        """Add or update a patient profile"""
+        with self._lock:
+            self.patients[patient.patient_id] = patient
+            self._commit()
+    
+    def get_patient(self, patient_id: str) -> Optional[PatientProfile]:
+        """Get a patient profile by ID"""
+        with self._lock:
+            return self.patients.get(patient_id)
+    
+    def get_patients(self) -> List[PatientProfile]:
+        """Get a snapshot of all patient profiles"""
+        with self._lock:
+            return list(self.patients.values())
+    
+    def get_patient_ids(self) -> List[str]:
+        """IDs of every patient with a profile or any stored assessment"""
+        with self._lock:
+            cold = {patient_id for patient_id, assessment_ids in self._cold_by_patient.items() if assessment_ids}
+            return list(set(self.patients) | set(self._hot_by_patient) | cold)
+    
+    def has_patient(self, patient_id: str) -> bool:
+        """Whether this store holds a profile or any assessment for the patient"""
+        with self._lock:
+            return (patient_id in self.patients or patient_id in self._hot_by_patient
+                    or bool(self._cold_by_patient.get(patient_id)))
+    
+    def remove_patient(self, patient_id: str):
+        """Remove a patient profile together with all of their assessments"""
+        with self._lock:
+            self.patients.pop(patient_id, None)
+            for assessment in self._hot_patient_assessments(patient_id):
+                self._remove_hot(assessment.assessment_id)
+                self.search_index.remove(assessment.assessment_id)
+            for assessment_id in list(self._cold_by_patient.get(patient_id, [])):
+                self._forget_cold(assessment_id)
+            self._cold_by_patient.pop(patient_id, None)
+            self.cold_timelines.pop(patient_id, None)
+            self.timelines.pop(patient_id, None)
+            self._commit()
+    
+    def add_assessment(self, assessment: HealthAssessment):
+        """Add a new health assessment"""
+        with self._lock:
+            previous = self.assessments.get(assessment.assessment_id)
+            replaced_patient_id = previous.patient_id if previous else None
+            if assessment.assessment_id in self.cold_assessments:
+                # Updating an archived assessment brings it back into the hot tier
+                replaced_patient_id = self._forget_cold(assessment.assessment_id)["patient_id"]
+            self._add_hot(assessment)
+            self._index_assessment(assessment, replaced_patient_id)
+            self._commit()
+    
+    def get_assessment(self, assessment_id: str) -> Optional[HealthAssessment]:
+        """Get an assessment by ID"""
+        with self._lock:
+            return self.assessments.get(assessment_id) or self._get_cold_assessment(assessment_id)
+    
+    def get_patient_assessments(self, patient_id: str) -> List[HealthAssessment]:
+        """Get all assessments for a specific patient"""
+        hot, archived = self.get_patient_assessments_by_tier(patient_id)
+        return hot + archived
+    
+    def get_patient_assessments_by_tier(self, patient_id: str) -> Tuple[List[HealthAssessment], List[HealthAssessment]]:
+        """Get a patient's hot and archived assessments, as a (hot, archived) pair"""
+        with self._lock:
+            hot = self._hot_patient_assessments(patient_id)
+            cold = [self._get_cold_assessment(assessment_id)
+                    for assessment_id in self._cold_by_patient.get(patient_id, [])]
+            return hot, [a for a in cold if a is not None]
+    
+    def get_open_assessments(self) -> List[HealthAssessment]:
+        """Get assessments that haven't been processed by a doctor yet"""
+        with self._lock:
+            return [a for a in self.assessments.values() if a.processed_at is None]
+    
+    def mark_processed(self, assessment_id: str, doctor_notes: str = "") -> bool:
+        """Record that a doctor has processed an assessment, making it eligible for archival"""
+        with self._lock:
+            assessment = self.assessments.get(assessment_id)
+            if assessment is None:
+                return False
+            assessment.processed_at = datetime.datetime.now()
+            assessment.doctor_notes = doctor_notes
+            self._commit()
+            return True
+    
+    def get_patient_timeline(self, patient_id: str) -> Dict:
+        """Get the materialized symptom/priority timeline for a patient, serialized with to_dict()"""
+        with self._lock:
+            timeline = self._patient_timeline(patient_id)
+            return (timeline or PatientTimeline(patient_id)).to_dict()
+    
+    def search_statistics(self, query: str) -> Tuple[int, Dict[str, int]]:
+        """Number of stored assessments and the document frequency of each
+        term of `query`, across both tiers"""
+        with self._lock:
+            hot_total, hot_frequencies = self.search_index.term_statistics(query)
+            cold_total, cold_frequencies = self._cold_index().term_statistics(query)
+        return hot_total + cold_total, {
+            term: count + cold_frequencies[term] for term, count in hot_frequencies.items()
         }
+    
+    def search_assessments(self, query: str = "", priority_level: Optional[str] = None,
+                           patient_id: Optional[str] = None, condition: Optional[str] = None,
+                           probability: Optional[str] = None, limit: int = 20,
+                           statistics: Optional[Tuple[int, Dict[str, int]]] = None
+                           ) -> List[Tuple[HealthAssessment, float]]:
+        """
+        Search assessments by content; see AssessmentSearchIndex.search for the arguments
+        
+        Both tiers are scored against `statistics` (from search_statistics(),
+        possibly summed over several stores), defaulting to this store's own.
+        """
+        with self._lock:
+            corpus_size, frequencies = statistics or self.search_statistics(query)
+            candidates = []
+            for index in (self.search_index, self._cold_index()):
+                for assessment_id, score in index.search(
+                        query, priority_level=priority_level, patient_id=patient_id,
+                        condition=condition, probability=probability, limit=limit,
+                        corpus_size=corpus_size, document_frequencies=frequencies):
+                    candidates.append((score, index.documents[assessment_id]["assessment_date"], assessment_id))
+            candidates.sort(reverse=True)
+            
+            matches = []
+            for score, _, assessment_id in candidates[:limit]:
+                assessment = self.get_assessment(assessment_id)
+                if assessment is not None:
+                    matches.append((assessment, score))
+            return matches
+    
+    # ---- Cold tier ----
+    
+    def _load_segment(self, segment: str) -> Dict[str, HealthAssessment]:
+        """Read an archive segment, keeping recently used ones decompressed in memory"""
+        with self._lock:
+            cached = self._segment_cache.get(segment)
+            if cached is not None:
+                self._segment_cache.move_to_end(segment)
+                return cached
+            
+            with gzip.open(os.path.join(self.archive_dir, segment), 'rt', encoding='utf-8') as f:
+                records = json.load(f)
+            assessments = {}
+            for assessment_data in records:
+                assessment = HealthAssessment.from_dict(assessment_data)
+                assessments[assessment.assessment_id] = assessment
+            
+            self._segment_cache[segment] = assessments
+            if len(self._segment_cache) > self.SEGMENT_CACHE_SIZE:
+                self._segment_cache.popitem(last=False)
+            return assessments
+    
+    def _get_cold_assessment(self, assessment_id: str) -> Optional[HealthAssessment]:
+        entry = self.cold_assessments.get(assessment_id)
+        if entry is None:
+            return None
+        try:
+            return self._load_segment(entry["segment"]).get(assessment_id)
+        except (FileNotFoundError, OSError, json.JSONDecodeError) as e:
+            print(f"Error reading archive segment {entry['segment']}: {e}")
+            return None
+    
+    @staticmethod
+    def _segment_index_name(segment: str) -> str:
+        return segment[:-len(".json.gz")] + ".index.json.gz"
+    
+    def _load_segment_index(self, segment: str) -> AssessmentSearchIndex:
+        """Read the search index written next to an archive segment, rebuilding
+        it from the segment if it is missing (e.g. after a crash between the two writes)"""
+        path = os.path.join(self.archive_dir, self._segment_index_name(segment))
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                return AssessmentSearchIndex.from_dict(json.load(f))
+        except (FileNotFoundError, OSError, json.JSONDecodeError):
+            pass
+        
+        index = AssessmentSearchIndex()
+        try:
+            assessments = self._load_segment(segment)
+        except (FileNotFoundError, OSError, json.JSONDecodeError) as e:
+            print(f"Error reading archive segment {segment}: {e}")
+            return index
+        for assessment in assessments.values():
+            index.add(assessment)
+        self._atomic_write_json(path, index.to_dict(), indent=None, compress=True)
+        return index
+    
+    def _forget_cold(self, assessment_id: str) -> Optional[Dict]:
+        """Drop an assessment from the archive's manifest and views"""
+        entry = self.cold_assessments.pop(assessment_id, None)
+        if entry is None:
+            return None
+        patient_ids = self._cold_by_patient.get(entry["patient_id"], [])
+        if assessment_id in patient_ids:
+            patient_ids.remove(assessment_id)
+        if self._cold_search_index is not None:
+            self._cold_search_index.remove(assessment_id)
+        self.cold_timelines.pop(entry["patient_id"], None)
+        self._stale_segments.add(entry["segment"])
+        self._manifest_dirty = True
+        return entry
+    
+    def _write_segments(self, assessments: List[HealthAssessment], now: datetime.datetime):
+        """
+        Write assessments to new segments and add them to the archive
+        
+        Writes one segment per month of assessment date, each with its search
+        index, then registers the assessments in the (unsaved) manifest and
+        the archive's views.
+        """
+        partitions: Dict[str, List[HealthAssessment]] = {}
+        for assessment in assessments:
+            partitions.setdefault(assessment.assessment_date.strftime("%Y-%m"), []).append(assessment)
+        
+        run_id = f"{now.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        for month, month_assessments in partitions.items():
+            segment = f"{month}/segment-{run_id}.json.gz"
+            os.makedirs(os.path.join(self.archive_dir, month), exist_ok=True)
+            index = AssessmentSearchIndex()
+            for assessment in month_assessments:
+                index.add(assessment)
+            self._atomic_write_json(os.path.join(self.archive_dir, segment),
+                                    [a.to_dict() for a in month_assessments], indent=None, compress=True)
+            self._atomic_write_json(os.path.join(self.archive_dir, self._segment_index_name(segment)),
+                                    index.to_dict(), indent=None, compress=True)
+            
+            if self._cold_search_index is not None:
+                self._cold_search_index.update(index)
+            for assessment in month_assessments:
+                if assessment.assessment_id not in self.cold_assessments:
+                    self._cold_by_patient.setdefault(assessment.patient_id, []).append(assessment.assessment_id)
+                self.cold_assessments[assessment.assessment_id] = {
+                    "segment": segment,
+                    "patient_id": assessment.patient_id,
+                    "assessment_date": assessment.assessment_date.isoformat()
+                }
+                timeline = self.cold_timelines.get(assessment.patient_id)
+                if timeline is not None:
+                    timeline.record(assessment)
+    
+    def archive_assessments(self, now: Optional[datetime.datetime] = None) -> int:
+        """
+        Move processed assessments older than the hot retention window into the archive.
+        
+        Each run writes one new immutable, gzip-compressed segment per month
+        of assessment date. Open assessments always stay hot.
+        
+        Returns:
+            Number of assessments archived
+        """
+        now = now or datetime.datetime.now()
+        cutoff = now - datetime.timedelta(days=self.hot_retention_days)
+        
+        with self._lock:
+            to_archive = [
+                a for a in list(self.assessments.values())
+                if a.processed_at is not None and a.processed_at <= cutoff
+            ]
+            if not to_archive:
+                return 0
+            
+            self._write_segments(to_archive, now)
+            
+            # Segments and manifest first, so the data is always in at least one tier.
+            # The combined timelines don't change: the assessments just switch tiers
+            self._save_manifest()
+            for assessment in to_archive:
+                self._remove_hot(assessment.assessment_id)
+                self.search_index.remove(assessment.assessment_id)
+            self._commit()
+            
+            return len(to_archive)
+    
+    def add_archived_assessments(self, assessments: Iterable[HealthAssessment],
+                                 now: Optional[datetime.datetime] = None) -> int:
+        """
+        Store assessments straight into the archive, e.g. when moving them from another store.
+        
+        Archived versions already stored here are replaced; assessments that
+        are stored here hot are skipped, since the hot copy is authoritative.
+        
+        Returns:
+            Number of assessments archived
+        """
+        with self._lock:
+            to_archive = [a for a in assessments if a.assessment_id not in self.assessments]
+            if not to_archive:
+                return 0
+            
+            for assessment in to_archive:
+                replaced = self._forget_cold(assessment.assessment_id)
+                if replaced is not None:
+                    for patient_id in {replaced["patient_id"], assessment.patient_id}:
+                        self.timelines.pop(patient_id, None)
+                elif assessment.patient_id in self.timelines:
+                    self.timelines[assessment.patient_id].record(assessment)
+            self._write_segments(to_archive, now or datetime.datetime.now())
+            self._save_manifest()
+            return len(to_archive)
+    
+    def compact_archive(self) -> int:
+        """
+        Rewrite archive segments that hold records which have left the archive
+        (brought back hot, moved to another store or removed), so that only
+        live records stay on disk.
+        
+        Deferred to here rather than done on every removal, so that moving
+        many patients off one segment rewrites it once. Skipped inside a batch,
+        whose rollback could still need the old segments.
+        
+        Returns:
+            Number of segments rewritten or deleted
+        """
+        with self._lock:
+            if getattr(self._batch_state, "depth", 0) or not self._stale_segments:
+                return 0
+            segments, self._stale_segments = self._stale_segments, set()
+            rewritten = []
+            for segment in sorted(segments):
+                try:
+                    records = self._load_segment(segment)
+                except (FileNotFoundError, OSError, json.JSONDecodeError):
+                    # Already gone, or unreadable; leave it alone
+                    continue
+                live = [a for assessment_id, a in records.items()
+                        if self.cold_assessments.get(assessment_id, {}).get("segment") == segment]
+                if len(live) == len(records):
+                    continue
+                if live:
+                    self._write_segments(live, datetime.datetime.now())
+                rewritten.append(segment)
+            if not rewritten:
+                return 0
+            
+            # Point the manifest at the new segments before deleting the old ones
+            self._save_manifest()
+            for segment in rewritten:
+                self._segment_cache.pop(segment, None)
+                for name in (segment, self._segment_index_name(segment)):
+                    try:
+                        os.remove(os.path.join(self.archive_dir, name))
+                    except FileNotFoundError:
+                        pass
+            return len(rewritten)
+    
+    def start_archival(self, interval_seconds: float = 3600):
+        """Run archive_assessments() and compact_archive() periodically on a
+        background thread (once per store)"""
+        def run(stop: threading.Event):
+            while not stop.wait(interval_seconds):
+                try:
+                    self.archive_assessments()
+                    self.compact_archive()
+                except Exception as e:
+                    print(f"Error archiving assessments: {e}")
+        
+        with self._lock:
+            if self._archival_stop is not None:
+                return
+            self._archival_stop = threading.Event()
+            threading.Thread(target=run, args=(self._archival_stop,), name="assessment-archival", daemon=True).start()
+    
+    def stop_archival(self):
+        """Stop the background archival thread"""
+        with self._lock:
+            if self._archival_stop is not None:
+                self._archival_stop.set()
+                self._archival_stop = None
+
+# ============ SHARDED STORAGE ============
+
+class ConsistentHashRing:
+    """Maps keys to nodes so that adding or removing a node only moves ~1/N of the keys"""
+    
+    def __init__(self, nodes: Iterable[str] = (), virtual_nodes: int = 64):
+        self.virtual_nodes = virtual_nodes
+        self._ring: List[Tuple[int, str]] = []
+        self._nodes: List[str] = []
+        for node in nodes:
+            self.add_node(node)
+    
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int(hashlib.md5(key.encode('utf-8')).hexdigest()[:16], 16)
+    
+    @property
+    def nodes(self) -> List[str]:
+        return list(self._nodes)
+    
+    def add_node(self, node: str):
+        if node in self._nodes:
+            return
+        self._nodes.append(node)
+        for i in range(self.virtual_nodes):
+            bisect.insort(self._ring, (self._hash(f"{node}#{i}"), node))
+    
+    def remove_node(self, node: str):
+        if node not in self._nodes:
+            return
+        self._nodes.remove(node)
+        self._ring = [entry for entry in self._ring if entry[1] != node]
+    
+    def get_node(self, key: str) -> str:
+        if not self._ring:
+            raise ValueError("Hash ring has no nodes")
+        index = bisect.bisect(self._ring, (self._hash(key), ""))
+        return self._ring[index % len(self._ring)][1]
+
+class ShardedDataStorage:
+    """
+    DataStorage router that spreads patients across several shard files.
+    
+    Each patient, together with their assessments, lives in exactly one
+    shard, chosen by consistent hashing of the patient ID. Each shard is a
+    regular DataStorage with its own file, lock and archive, so writes for
+    different patients don't contend. Cross-patient reads (open assessments,
+    search) are merged across shards.
+    
+    Shards can be added or removed while serving requests; patients are
+    moved one at a time and reads check both the old and new owner until
+    the move completes.
+    """
+    # Writes for a patient serialize on one of these locks, so writes for
+    # different patients (and shards) proceed in parallel
+    LOCK_STRIPES = 64
+    
+    def __init__(self, storage_file: str = "healthcare_data.json", shard_count: int = 4,
+                 hot_retention_days: int = 30, virtual_nodes: int = 64):
+        """
+        Args:
+            storage_file: Base data file name; shards are stored as "<base>.<shard>.json".
+                If it exists when the shards are first created, its contents are imported;
+                the topology is only saved once that import completes, so an
+                interrupted import is redone on the next start.
+            shard_count: Number of shards to create (ignored once a topology exists)
+            hot_retention_days: Passed to each shard's DataStorage
+            virtual_nodes: Points per shard on the hash ring
+        """
+        self._base = os.path.splitext(storage_file)[0]
+        self.topology_file = self._base + ".shards.json"
+        self.hot_retention_days = hot_retention_days
+        self.virtual_nodes = virtual_nodes
+        self.shards: Dict[str, DataStorage] = {}
+        self._assessment_shard: Dict[str, str] = {}  # assessment_id -> shard name
+        self._target_ring: Optional[ConsistentHashRing] = None  # set while resharding
+        self._lock = threading.RLock()  # guards topology changes
+        self._patient_locks = [threading.Lock() for _ in range(self.LOCK_STRIPES)]
+        self._batch_state = threading.local()  # writes buffered by this thread's open batch
+        
+        topology = self._load_topology()
+        is_new = topology is None
+        if is_new:
+            topology = {"shards": [f"shard-{i}" for i in range(shard_count)]}
+        
+        for name in topology["shards"] + topology.get("target", []):
+            self._open_shard(name)
+        self.ring = ConsistentHashRing(topology["shards"], virtual_nodes)
+        
+        if topology.get("target"):
+            # Finish a resharding that was interrupted
+            self._reshard(topology["target"])
+        else:
+            if is_new and os.path.exists(storage_file):
+                self._import_unsharded(storage_file)
+            self._save_topology()
+    
+    def _open_shard(self, name: str):
+        if name in self.shards:
+            return
+        shard = DataStorage(f"{self._base}.{name}.json", hot_retention_days=self.hot_retention_days)
+        self.shards[name] = shard
+        for assessment_id in list(shard.assessments) + list(shard.cold_assessments):
+            self._assessment_shard[assessment_id] = name
+    
+    def _load_topology(self) -> Optional[Dict]:
+        try:
+            with open(self.topology_file, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+    
+    def _save_topology(self):
+        topology = {"shards": self.ring.nodes}
+        if self._target_ring is not None:
+            topology["target"] = self._target_ring.nodes
+        DataStorage._atomic_write_json(self.topology_file, topology)
+    
+    def _import_unsharded(self, storage_file: str):
+        """Copy an existing single-file store into the shards, keeping archived assessments archived"""
+        legacy = DataStorage(storage_file, hot_retention_days=self.hot_retention_days)
+        archived: Dict[str, List[HealthAssessment]] = {}  # shard name -> assessments
+        with self.batch():
+            for patient in legacy.patients.values():
+                self.add_patient(patient)
+            for patient_id in legacy.get_patient_ids():
+                hot, cold = legacy.get_patient_assessments_by_tier(patient_id)
+                for assessment in hot:
+                    self.add_assessment(assessment)
+                if cold:
+                    archived.setdefault(self._owner(patient_id), []).extend(cold)
+        for name, assessments in archived.items():
+            self.shards[name].add_archived_assessments(assessments)
+            for assessment in assessments:
+                self._assessment_shard[assessment.assessment_id] = name
+    
+    # ---- Routing ----
+    
+    def _stripe(self, patient_id: str) -> int:
+        return ConsistentHashRing._hash(patient_id) % self.LOCK_STRIPES
+    
+    def _patient_lock(self, patient_id: str) -> threading.Lock:
+        return self._patient_locks[self._stripe(patient_id)]
+    
+    def _owner(self, patient_id: str) -> str:
+        """Name of the shard that writes for this patient should go to"""
+        target_ring = self._target_ring
+        current = self.ring.get_node(patient_id)
+        if target_ring is None or self.shards[current].has_patient(patient_id):
+            return current
+        # Resharding: patients not (or no longer) on their old shard belong to the new one
+        return target_ring.get_node(patient_id)
+    
+    def _candidates(self, patient_id: str) -> List[DataStorage]:
+        """Shards that may hold this patient's data"""
+        target_ring = self._target_ring
+        names = [self.ring.get_node(patient_id)]
+        if target_ring is not None:
+            target = target_ring.get_node(patient_id)
+            if target not in names:
+                names.append(target)
+        return [self.shards[name] for name in names]
+    
+    # ---- DataStorage API ----
+    
+    @property
+    def patients(self) -> ChainMap:
+        """Read-only merged view of all shards' patients"""
+        return ChainMap(*[shard.patients for shard in self.shards.values()])
+    
+    @property
+    def assessments(self) -> ChainMap:
+        """Read-only merged view of all shards' hot assessments"""
+        return ChainMap(*[shard.assessments for shard in self.shards.values()])
+    
+    @contextmanager
+    def batch(self):
+        """
+        Group mutations so that each touched shard is written once.
         
-        with open(self.storage_file, 'w') as f:
-            json.dump(data, f, indent=2)
+        Patients and assessments added inside the block are buffered for
+        this thread and stored when the outermost batch exits, taking the
+        locks of just the patients and shards involved. Until then they are
+        not visible to reads; if the block raises, they are dropped.
+        """
+        state = self._batch_state
+        outermost = getattr(state, "pending", None) is None
+        if outermost:
+            state.pending = []
+        try:
+            yield self
+        except BaseException:
+            if outermost:
+                state.pending = None
+            raise
+        if outermost:
+            pending, state.pending = state.pending, None
+            self._write(pending)
+    
+    def _write(self, records: List[Union[PatientProfile, HealthAssessment]]):
+        """Store patients/assessments on their owning shards, or buffer them in this thread's open batch"""
+        pending = getattr(self._batch_state, "pending", None)
+        if pending is not None:
+            pending.extend(records)
+            return
+        if not records:
+            return
+        
+        with ExitStack() as stack:
+            # Patient locks before shard locks, each in a fixed order, so
+            # concurrent batches and patient moves can't deadlock
+            for stripe in sorted({self._stripe(record.patient_id) for record in records}):
+                stack.enter_context(self._patient_locks[stripe])
+            owners = [self._owner(record.patient_id) for record in records]
+            for name in sorted(set(owners)):
+                stack.enter_context(self.shards[name].batch())
+            
+            for record, name in zip(records, owners):
+                if isinstance(record, HealthAssessment):
+                    self.shards[name].add_assessment(record)
+                    self._assessment_shard[record.assessment_id] = name
+                else:
+                    self.shards[name].add_patient(record)
+    
+    def bulk_import(self, patients: Iterable[Union[PatientProfile, Dict]] = (),
+                    assessments: Iterable[Union[HealthAssessment, Dict]] = ()) -> Dict[str, int]:
+        """Import many patients and assessments with a single commit per shard"""
+        counts = {"patients": 0, "assessments": 0}
+        with self.batch():
+            for patient in patients:
+                if isinstance(patient, dict):
+                    patient = PatientProfile.from_dict(patient)
+                self.add_patient(patient)
+                counts["patients"] += 1
+            for assessment in assessments:
+                if isinstance(assessment, dict):
+                    assessment = HealthAssessment.from_dict(assessment)
+                self.add_assessment(assessment)
+                counts["assessments"] += 1
+        return counts
     
     def add_patient(self, patient: PatientProfile):
         """Add or update a patient profile"""
-        self.patients[patient.patient_id] = patient
-        self.save_data()
+        self._write([patient])
     
     def get_patient(self, patient_id: str) -> Optional[PatientProfile]:
         """Get a patient profile by ID"""
-        return self.patients.get(patient_id)
+        for shard in self._candidates(patient_id):
+            patient = shard.get_patient(patient_id)
+            if patient:
+                return patient
+        return None
+    
+    def get_patients(self) -> List[PatientProfile]:
+        """Get a snapshot of all patient profiles, across shards"""
+        found: Dict[str, PatientProfile] = {}
+        for shard in list(self.shards.values()):
+            for patient in shard.get_patients():
+                found.setdefault(patient.patient_id, patient)
+        return list(found.values())
     
     def add_assessment(self, assessment: HealthAssessment):
         """Add a new health assessment"""
-        self.assessments[assessment.assessment_id] = assessment
-        self.save_data()
+        self._write([assessment])
     
     def get_assessment(self, assessment_id: str) -> Optional[HealthAssessment]:
         """Get an assessment by ID"""
-        return self.assessments.get(assessment_id)
+        name = self._assessment_shard.get(assessment_id)
+        return self.shards[name].get_assessment(assessment_id) if name in self.shards else None
     
     def get_patient_assessments(self, patient_id: str) -> List[HealthAssessment]:
         """Get all assessments for a specific patient"""
-        return [a for a in self.assessments.values() if a.patient_id == patient_id]
+        found: Dict[str, HealthAssessment] = {}
+        for shard in self._candidates(patient_id):
+            for assessment in shard.get_patient_assessments(patient_id):
+                found.setdefault(assessment.assessment_id, assessment)
+        return list(found.values())
+    
+    def get_patient_timeline(self, patient_id: str) -> Dict:
+        """Get the materialized symptom/priority timeline for a patient, serialized with to_dict()"""
+        for shard in self._candidates(patient_id):
+            if shard.has_patient(patient_id):
+                return shard.get_patient_timeline(patient_id)
+        return PatientTimeline(patient_id).to_dict()
+    
+    def get_open_assessments(self) -> List[HealthAssessment]:
+        """Get assessments that haven't been processed by a doctor yet, across all shards"""
+        return [a for shard in list(self.shards.values()) for a in shard.get_open_assessments()]
+    
+    def mark_processed(self, assessment_id: str, doctor_notes: str = "") -> bool:
+        """Record that a doctor has processed an assessment"""
+        assessment = self.get_assessment(assessment_id)
+        if assessment is None:
+            return False
+        with self._patient_lock(assessment.patient_id):
+            name = self._assessment_shard.get(assessment_id)
+            return name in self.shards and self.shards[name].mark_processed(assessment_id, doctor_notes)
+    
+    def search_assessments(self, query: str = "", priority_level: Optional[str] = None,
+                           patient_id: Optional[str] = None, condition: Optional[str] = None,
+                           probability: Optional[str] = None, limit: int = 20) -> List[Tuple[HealthAssessment, float]]:
+        """Search assessments by content across shards; see AssessmentSearchIndex.search"""
+        # Each shard scores against corpus-wide term statistics, so scores
+        # from different shards can be ranked together
+        shard_statistics = [shard.search_statistics(query) for shard in list(self.shards.values())]
+        statistics = (
+            sum(total for total, _ in shard_statistics),
+            {term: sum(frequencies[term] for _, frequencies in shard_statistics)
+             for term in shard_statistics[0][1]}
+        )
+        
+        shards = self._candidates(patient_id) if patient_id else list(self.shards.values())
+        results: Dict[str, Tuple[HealthAssessment, float]] = {}
+        for shard in shards:
+            for assessment, score in shard.search_assessments(
+                    query, priority_level=priority_level, patient_id=patient_id,
+                    condition=condition, probability=probability, limit=limit,
+                    statistics=statistics):
+                results.setdefault(assessment.assessment_id, (assessment, score))
+        merged = sorted(results.values(), key=lambda r: (r[1], r[0].assessment_date), reverse=True)
+        return merged[:limit]
+    
+    def archive_assessments(self, now: Optional[datetime.datetime] = None) -> int:
+        """Archive old processed assessments on every shard"""
+        return sum(shard.archive_assessments(now) for shard in list(self.shards.values()))
+    
+    def compact_archive(self) -> int:
+        """Compact every shard's archive"""
+        return sum(shard.compact_archive() for shard in list(self.shards.values()))
+    
+    def start_archival(self, interval_seconds: float = 3600):
+        for shard in self.shards.values():
+            shard.start_archival(interval_seconds)
+    
+    def stop_archival(self):
+        for shard in self.shards.values():
+            shard.stop_archival()
+    
+    # ---- Resharding ----
+    
+    def add_shard(self, name: Optional[str] = None) -> str:
+        """
+        Add a shard and move the patients that now hash to it.
+        
+        Returns:
+            The new shard's name
+        """
+        with self._lock:
+            if name is None:
+                index = len(self.shards)
+                while f"shard-{index}" in self.shards:
+                    index += 1
+                name = f"shard-{index}"
+            if name in self.ring.nodes:
+                raise ValueError(f"Shard {name} already exists")
+            self._open_shard(name)
+        self._reshard(self.ring.nodes + [name])
+        return name
+    
+    def remove_shard(self, name: str):
+        """Move all patients off a shard and stop using it (its files are left in place)"""
+        nodes = self.ring.nodes
+        if name not in nodes:
+            raise ValueError(f"Unknown shard {name}")
+        if len(nodes) == 1:
+            raise ValueError("Cannot remove the last shard")
+        self._reshard([n for n in nodes if n != name])
+        with self._lock:
+            self.shards.pop(name).stop_archival()
+    
+    def _reshard(self, target_nodes: List[str]):
+        """Move every patient whose owner differs under `target_nodes`, one patient at a time"""
+        with self._lock:
+            if self._target_ring is not None and self._target_ring.nodes != target_nodes:
+                raise RuntimeError("A resharding is already in progress")
+            self._target_ring = ConsistentHashRing(target_nodes, self.virtual_nodes)
+            self._save_topology()
+        
+        # Repeat until a full pass moves nothing, to catch patients written
+        # to an old shard while it was being scanned
+        moved = True
+        while moved:
+            moved = False
+            for source_name in list(self.shards):
+                source = self.shards[source_name]
+                for patient_id in source.get_patient_ids():
+                    moved = self._move_patient(patient_id, source_name) or moved
+        
+        with self._lock:
+            self.ring = self._target_ring
+            self._target_ring = None
+            self._save_topology()
+        # Drop the moved patients' archived records from their old shards' segments
+        self.compact_archive()
+    
+    def _move_patient(self, patient_id: str, source_name: str) -> bool:
+        # Holding the patient's lock keeps writes for this patient out while it moves
+        with self._patient_lock(patient_id):
+            target_name = self._target_ring.get_node(patient_id)
+            source = self.shards[source_name]
+            if target_name == source_name or not source.has_patient(patient_id):
+                return False
+            target = self.shards[target_name]
+            
+            patient = source.get_patient(patient_id)
+            hot, archived = source.get_patient_assessments_by_tier(patient_id)
+            # Copy first, then delete, so the data is always readable from one
+            # of the two shards. Archived assessments stay archived on the target
+            with target.batch():
+                if patient:
+                    target.add_patient(patient)
+                for assessment in hot:
+                    target.add_assessment(assessment)
+                target.add_archived_assessments(archived)
+            for assessment in hot + archived:
+                self._assessment_shard[assessment.assessment_id] = target_name
+            source.remove_patient(patient_id)
+            return True
 
 # ============ SAMPLE USAGE ============
 
@@ -497,7 +1942,6 @@ def demo():
     patient.medical_history = ["Hypertension", "Type 2 Diabetes"]
     patient.allergies = ["Penicillin"]
     patient.current_medications = ["Lisinopril", "Metformin"]
-    storage.add_patient(patient)
     
     # Create conversation manager
     conversation = ConversationManager(patient_id)
@@ -520,8 +1964,10 @@ def demo():
             patient_msg = conversation.conversation_history[i*2]["message"]
             print(f"Patient: {patient_msg}\n")
     
-    # Save the assessment
-    storage.add_assessment(conversation.current_assessment)
+    # Save the patient and assessment in one write
+    with storage.batch():
+        storage.add_patient(patient)
+        storage.add_assessment(conversation.current_assessment)
     
     # Create doctor interface and add the assessment
     doctor_interface = DoctorInterface()
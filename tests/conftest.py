@@ -0,0 +1,54 @@
+import datetime
+import importlib.machinery
+import importlib.util
+import os
+import sys
+from typing import Optional, Tuple, Union
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _load_module(name: str, filename: str):
+    loader = importlib.machinery.SourceFileLoader(name, os.path.join(ROOT, filename))
+    spec = importlib.util.spec_from_loader(name, loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+
+
+# The modules' file names don't match the names the app imports them by
+if "healthcare_assistant" not in sys.modules:
+    _load_module("healthcare_assistant", "heathcare_assistant.py")
+if "chatgpt_integration" not in sys.modules:
+    _load_module("chatgpt_integration", "chatgpt_integration")
+
+
+from healthcare_assistant import HealthAssessment, PatientProfile, Symptom  # noqa: E402
+
+# Fixed "today" for tests that depend on assessment age
+NOW = datetime.datetime(2024, 6, 1)
+
+
+def make_patient(patient_id: str = "p-1", name: Optional[str] = None) -> PatientProfile:
+    return PatientProfile(patient_id, name or patient_id, 40, "Not specified")
+
+
+def make_assessment(patient_id: str = "p-1", *symptoms: Union[str, Tuple[str, int]],
+                    days_ago: Optional[int] = None, processed: bool = False) -> HealthAssessment:
+    """
+    Build a scored assessment
+
+    Symptoms are names or (name, severity) pairs and default to a headache.
+    With `days_ago`, the assessment is dated that long before NOW; with
+    `processed`, a doctor reviewed it the day after.
+    """
+    assessment = HealthAssessment(patient_id)
+    if days_ago is not None:
+        assessment.assessment_date = NOW - datetime.timedelta(days=days_ago)
+    for symptom in symptoms or ("headache",):
+        name, severity = (symptom, 5) if isinstance(symptom, str) else symptom
+        assessment.add_symptom(Symptom(name, severity, 3, f"{name} since the weekend"))
+    assessment.calculate_priority()
+    if processed:
+        assessment.processed_at = assessment.assessment_date + datetime.timedelta(days=1)
+    return assessment
@@ -0,0 +1,253 @@
+import json
+import threading
+
+import pytest
+import requests
+
+import chatgpt_integration
+from chatgpt_integration import (
+    BackgroundExtractor, ChatGPTManager, IncrementalJSONParser, integrate_with_health_assessment,
+    merge_medical_data
+)
+from healthcare_assistant import DataStorage, HealthAssessment, PatientProfile
+
+RESPONSE = {
+    "patient_demographics": {"age": 52, "gender": "male"},
+    "primary_symptoms": ["chest pain", "shortness of breath"],
+    "symptom_details": [{"name": "chest pain", "severity": 8, "duration": "2 days"}],
+    "allergies": ["penicillin"],
+    "urgency_assessment": "high",
+    "condition_predictions": [{"condition": "Angina", "probability_range": "High",
+                               "key_matching_symptoms": ["chest pain"], "recommended_tests": ["ECG"]}]
+}
+
+
+def feed_in_chunks(parser, text, size):
+    completed = []
+    for start in range(0, len(text), size):
+        completed.extend(parser.feed(text[start:start + size]))
+    return completed
+
+
+@pytest.mark.parametrize("size", [1, 7, 64, 10000])
+def test_parser_reports_fields_as_they_complete(size):
+    text = "Here is the record:\n```json\n" + json.dumps(RESPONSE, indent=2) + "\n```"
+    parser = IncrementalJSONParser()
+
+    completed = feed_in_chunks(parser, text, size)
+
+    assert [key for key, _ in completed] == list(RESPONSE)
+    assert dict(completed) == RESPONSE
+    assert parser.close() == RESPONSE
+
+
+@pytest.mark.parametrize("size", [1, 5, 10000])
+@pytest.mark.parametrize("text", [
+    'Sure {see below}: {"a": 1}',
+    'Notes [1] and {"draft"} aside, the record: {"a": 1}',
+    '[a] Result:\n```json\n{"a": 1}\n```'
+])
+def test_parser_skips_bracketed_prose(text, size):
+    parser = IncrementalJSONParser()
+
+    completed = feed_in_chunks(parser, text, size)
+
+    assert completed == [("a", 1)]
+    assert parser.close() == {"a": 1}
+
+
+def test_parser_reports_field_before_document_ends():
+    parser = IncrementalJSONParser()
+    assert parser.feed('{"allergies": ["dust", "pollen"]') == []
+    assert parser.feed(', "urgency') == [("allergies", ["dust", "pollen"])]
+
+
+def test_parser_repairs_truncated_response():
+    text = json.dumps(RESPONSE)
+    truncated = text[:text.index('"urgency_assessment"') + len('"urgency_assessment": "hi')]
+    parser = IncrementalJSONParser()
+    feed_in_chunks(parser, truncated, 5)
+
+    result = parser.close()
+
+    assert result["allergies"] == ["penicillin"]
+    assert result["urgency_assessment"] == "hi"
+    assert "condition_predictions" not in result
+
+
+def test_parser_falls_back_to_completed_fields():
+    parser = IncrementalJSONParser()
+    parser.feed('{"allergies": ["dust"], "symptom_details": [{"name": "cough", "severity": }')
+
+    assert parser.close() == {"allergies": ["dust"]}
+
+
+def test_parser_rejects_text_without_json():
+    parser = IncrementalJSONParser()
+    parser.feed("Sorry, I can't help with that.")
+
+    with pytest.raises(ValueError):
+        parser.close()
+
+
+class FakeStream:
+    """Stands in for a streamed requests response"""
+
+    def __init__(self, text, fail_after=None):
+        self.text = text
+        self.fail_after = fail_after
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_lines(self, decode_unicode=False):
+        for i in range(0, len(self.text), 10):
+            if self.fail_after is not None and i >= self.fail_after:
+                raise requests.ConnectionError("connection reset")
+            chunk = {"choices": [{"delta": {"content": self.text[i:i + 10]}}]}
+            yield "data: " + json.dumps(chunk)
+        yield "data: [DONE]"
+
+
+def make_storage(tmp_path):
+    storage = DataStorage(str(tmp_path / "data.json"))
+    storage.add_patient(PatientProfile("p-1", "bob", 50, "Not specified"))
+    return storage
+
+
+def test_integrate_applies_streamed_fields(tmp_path, monkeypatch):
+    storage = make_storage(tmp_path)
+    monkeypatch.setattr(chatgpt_integration.requests, "post",
+                        lambda *args, **kwargs: FakeStream(json.dumps(RESPONSE)))
+    assessment = HealthAssessment("p-1")
+
+    patient = integrate_with_health_assessment(ChatGPTManager("key"), assessment, storage, save_patient=False)
+
+    assert patient.age == 52 and patient.allergies == ["penicillin"]
+    assert [s.name for s in assessment.symptoms] == ["chest pain"]
+    assert assessment.condition_predictions[0]["condition"] == "Angina"
+    # Nothing is stored until the caller saves the returned profile
+    assert storage.get_patient("p-1").allergies == []
+
+
+def test_integrate_leaves_profile_alone_when_stream_fails(tmp_path, monkeypatch):
+    storage = make_storage(tmp_path)
+    text = json.dumps(RESPONSE)
+    monkeypatch.setattr(chatgpt_integration.requests, "post",
+                        lambda *args, **kwargs: FakeStream(text, fail_after=text.index('"urgency')))
+
+    patient = integrate_with_health_assessment(ChatGPTManager("key"), HealthAssessment("p-1"), storage)
+
+    assert patient is None
+    stored = storage.get_patient("p-1")
+    assert stored.age == 50 and stored.allergies == []
+    assert DataStorage(str(tmp_path / "data.json")).get_patient("p-1").allergies == []
+
+
+def test_merge_extends_lists_and_merges_symptoms_by_name():
+    record = {
+        "primary_symptoms": ["headache"],
+        "symptom_details": [{"name": "Headache", "severity": 4, "duration": "2 days"}],
+        "patient_demographics": {"age": 30, "gender": None},
+        "condition_predictions": [{"condition": "Migraine"}]
+    }
+    delta = {
+        "primary_symptoms": ["headache", "nausea"],
+        "symptom_details": [{"name": "headache ", "severity": 7, "duration": None},
+                            {"name": "Nausea", "severity": 3}],
+        "patient_demographics": {"age": None, "gender": "female"},
+        "condition_predictions": [{"condition": "Tension headache"}],
+        "allergies": [],
+        "urgency_assessment": None,
+        "extraction_failed": True
+    }
+
+    merged = merge_medical_data(record, delta)
+
+    assert merged["primary_symptoms"] == ["headache", "nausea"]
+    assert merged["symptom_details"] == [{"name": "headache ", "severity": 7, "duration": "2 days"},
+                                         {"name": "Nausea", "severity": 3}]
+    assert merged["patient_demographics"] == {"age": 30, "gender": "female"}
+    assert merged["condition_predictions"] == [{"condition": "Tension headache"}]
+    assert "allergies" not in merged and "urgency_assessment" not in merged
+    assert "extraction_failed" not in merged
+    # The input record is left untouched
+    assert record["primary_symptoms"] == ["headache"]
+    assert record["symptom_details"][0]["severity"] == 4
+
+
+class FakeManager:
+    """Stands in for ChatGPTManager.extract_incremental"""
+
+    def __init__(self, results):
+        self.results = list(results)
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def extract_incremental(self, known_record, new_messages, include_predictions=False, patient_profile=None):
+        self.started.set()
+        self.release.wait(5)
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+HISTORY = [{"role": "system", "content": "..."}, {"role": "user", "content": "I have a headache"}]
+
+
+def wait_idle(extractor, conversation_id):
+    future = extractor._conversations[conversation_id].future
+    if future is not None:
+        future.result(5)
+
+
+def test_extractor_does_not_publish_after_discard():
+    updates = []
+    extractor = BackgroundExtractor("key", on_update=lambda *args: updates.append(args))
+    extractor.manager = FakeManager([{"primary_symptoms": ["headache"]}])
+    extractor.manager.release.clear()
+
+    extractor.schedule("c-1", HISTORY, "p-1")
+    assert extractor.manager.started.wait(5)
+    state = extractor._conversations["c-1"]
+    extractor.discard("c-1")
+    extractor.manager.release.set()
+    state.future.result(5)
+
+    assert updates == []
+    assert extractor.get_record("c-1") is None
+
+
+def test_extractor_recovers_from_unexpected_errors():
+    updates = []
+    extractor = BackgroundExtractor("key", on_update=lambda *args: updates.append(args))
+    extractor.manager = FakeManager([TypeError("bad response"), {"primary_symptoms": ["headache"]}])
+
+    extractor.schedule("c-1", HISTORY, "p-1")
+    wait_idle(extractor, "c-1")
+    assert extractor._conversations["c-1"].future is None
+
+    extractor.schedule("c-1", HISTORY, "p-1")
+    wait_idle(extractor, "c-1")
+    assert updates == [("c-1", "p-1", {"primary_symptoms": ["headache"]})]
+
+
+def test_extractor_expires_idle_conversations():
+    expired = []
+    extractor = BackgroundExtractor("key", idle_timeout=0, on_expire=expired.append)
+    extractor.manager = FakeManager([{"primary_symptoms": ["headache"]}])
+
+    extractor.schedule("c-1", HISTORY, "p-1")
+    wait_idle(extractor, "c-1")
+
+    assert extractor.expire_idle() == ["c-1"]
+    assert expired == ["c-1"]
+    assert extractor.get_record("c-1") is None
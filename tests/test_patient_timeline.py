@@ -0,0 +1,42 @@
+from conftest import make_assessment
+from healthcare_assistant import DataStorage, HealthAssessment, PatientTimeline
+
+
+def test_counts_each_assessment_once_per_symptom():
+    first = make_assessment("p-1", ("Headache", 4), ("headache ", 7), ("Nausea", 2), days_ago=10)
+    second = make_assessment("p-1", ("headache", 5), days_ago=2)
+    timeline = PatientTimeline.from_assessments("p-1", [second, first])
+
+    headache = timeline.symptom_occurrences["headache"]
+    assert headache["count"] == 2
+    assert [e["severity"] for e in headache["severities"]] == [7, 5]
+    assert headache["first_seen"] == first.assessment_date
+    assert timeline.symptom_occurrences["nausea"]["count"] == 1
+
+    # Recording the same assessment again changes nothing
+    timeline.record(first)
+    assert timeline.symptom_occurrences["headache"]["count"] == 2
+
+
+def test_round_trips_through_dict():
+    timeline = PatientTimeline.from_assessments("p-1", [make_assessment("p-1", ("Cough", 3), days_ago=5)])
+    restored = PatientTimeline.from_dict(timeline.to_dict())
+    assert restored.to_dict() == timeline.to_dict()
+
+
+def test_storage_timeline_follows_replaced_assessment(tmp_path):
+    storage = DataStorage(str(tmp_path / "data.json"))
+    moved = make_assessment("p-1", "cough")
+    storage.add_assessment(make_assessment("p-1", "headache"))
+    storage.add_assessment(moved)
+
+    moved = HealthAssessment.from_dict({**moved.to_dict(), "patient_id": "p-2"})
+    storage.add_assessment(moved)
+
+    assert storage.get_patient_timeline("p-1")["assessment_count"] == 1
+    timeline = storage.get_patient_timeline("p-2")
+    assert timeline["assessment_ids"] == [moved.assessment_id]
+    assert [a.assessment_id for a in storage.get_patient_assessments("p-2")] == [moved.assessment_id]
+    # Callers get a serialized copy, not the live view
+    timeline["assessment_ids"].clear()
+    assert storage.get_patient_timeline("p-2")["assessment_count"] == 1
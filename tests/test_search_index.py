@@ -0,0 +1,90 @@
+import json
+
+from conftest import make_assessment
+from healthcare_assistant import AssessmentSearchIndex, DataStorage, HealthAssessment
+
+
+def predict(assessment: HealthAssessment, condition: str, probability: str) -> HealthAssessment:
+    assessment.condition_predictions.append({"condition": condition, "probability_range": probability,
+                                             "recommended_tests": ["Chest X-ray"]})
+    return assessment
+
+
+def result_ids(index: AssessmentSearchIndex, query: str = "", **filters):
+    return {assessment_id for assessment_id, _ in index.search(query, **filters)}
+
+
+def test_every_query_term_must_match():
+    index = AssessmentSearchIndex()
+    both = make_assessment("p-1", "chest pain", "cough")
+    pain_only = make_assessment("p-2", "back pain")
+    for assessment in (both, pain_only):
+        index.add(assessment)
+
+    assert result_ids(index, "pain") == {both.assessment_id, pain_only.assessment_id}
+    assert result_ids(index, "pain cough") == {both.assessment_id}
+    assert result_ids(index, "pain fever") == set()
+    # Stop words don't have to match
+    assert result_ids(index, "the cough") == {both.assessment_id}
+
+
+def test_filters_narrow_matches():
+    index = AssessmentSearchIndex()
+    high = predict(make_assessment("p-1", ("shortness of breath", 9), ("fever", 9)), "Pneumonia", "High")
+    low = predict(make_assessment("p-2", "shortness of breath"), "Pneumonia", "Low")
+    other = predict(make_assessment("p-3", "shortness of breath"), "Asthma", "High")
+    for assessment in (high, low, other):
+        index.add(assessment)
+
+    assert result_ids(index, "shortness of breath", condition="pneumonia", probability="High") == {high.assessment_id}
+    assert result_ids(index, "shortness of breath", condition="pneumonia") == {high.assessment_id, low.assessment_id}
+    assert result_ids(index, "breath", probability="high") == {high.assessment_id, other.assessment_id}
+    assert result_ids(index, priority_level="critical") == {high.assessment_id}
+    assert result_ids(index, "breath", patient_id="p-2") == {low.assessment_id}
+
+
+def test_replacing_assessment_drops_old_postings():
+    index = AssessmentSearchIndex()
+    assessment = make_assessment("p-1", "migraine")
+    index.add(assessment)
+
+    replacement = HealthAssessment.from_dict(assessment.to_dict())
+    replacement.symptoms[0].name = "sinusitis"
+    replacement.symptoms[0].description = "blocked nose"
+    index.add(replacement)
+
+    assert result_ids(index, "migraine") == set()
+    assert result_ids(index, "sinusitis") == {assessment.assessment_id}
+    assert "migraine" not in index.postings
+    assert index.term_statistics("sinusitis") == (1, {"sinusitis": 1})
+
+
+def test_sidecar_is_reused_when_generation_matches(tmp_path, monkeypatch):
+    storage_file = str(tmp_path / "data.json")
+    assessment = make_assessment("p-1", "cough")
+    DataStorage(storage_file).add_assessment(assessment)
+
+    def no_rebuild(self, include_cold=True):
+        raise AssertionError("index was rebuilt")
+    with monkeypatch.context() as patch:
+        patch.setattr(DataStorage, "_rebuild_derived_data", no_rebuild)
+        reloaded = DataStorage(storage_file)
+    assert [a.assessment_id for a, _ in reloaded.search_assessments("cough")] == [assessment.assessment_id]
+
+
+def test_sidecar_is_rebuilt_when_generation_differs(tmp_path):
+    storage_file = str(tmp_path / "data.json")
+    storage = DataStorage(storage_file)
+    assessment = make_assessment("p-1", "cough")
+    storage.add_assessment(assessment)
+    # A stale sidecar, as left by a crash between the data file and index writes
+    with open(storage.index_file) as f:
+        sidecar = json.load(f)
+    sidecar["generation"] = "stale"
+    sidecar["postings"] = {"wheeze": {assessment.assessment_id: 3.0}}
+    with open(storage.index_file, "w") as f:
+        json.dump(sidecar, f)
+
+    reloaded = DataStorage(storage_file)
+    assert reloaded.search_assessments("wheeze") == []
+    assert [a.assessment_id for a, _ in reloaded.search_assessments("cough")] == [assessment.assessment_id]
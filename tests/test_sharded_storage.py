@@ -0,0 +1,177 @@
+import glob
+import gzip
+import json
+import os
+import threading
+
+import pytest
+
+from conftest import NOW, make_assessment, make_patient
+from healthcare_assistant import DataStorage, ShardedDataStorage
+
+
+def owners(storage: ShardedDataStorage, patient_id: str):
+    return [name for name, shard in storage.shards.items() if patient_id in shard.get_patient_ids()]
+
+
+def test_batch_only_writes_touched_shards(tmp_path, monkeypatch):
+    storage = ShardedDataStorage(str(tmp_path / "data.json"), shard_count=4)
+    saves = []
+    for name, shard in storage.shards.items():
+        monkeypatch.setattr(shard, "save_data", lambda name=name: saves.append(name))
+
+    patient = make_patient("p-1")
+    with storage.batch():
+        storage.add_patient(patient)
+        storage.add_assessment(make_assessment(patient.patient_id))
+        # Buffered until the batch exits
+        assert storage.get_patient(patient.patient_id) is None
+
+    assert saves == [storage.ring.get_node(patient.patient_id)]
+    assert len(storage.get_patient_assessments(patient.patient_id)) == 1
+
+
+def test_batch_rollback_drops_buffered_writes(tmp_path):
+    storage = ShardedDataStorage(str(tmp_path / "data.json"), shard_count=2)
+    with pytest.raises(RuntimeError):
+        with storage.batch():
+            storage.add_patient(make_patient("p-1"))
+            raise RuntimeError("boom")
+
+    storage.add_patient(make_patient("p-2"))
+    assert [p.patient_id for p in storage.get_patients()] == ["p-2"]
+
+
+def test_interrupted_import_is_redone(tmp_path, monkeypatch):
+    storage_file = str(tmp_path / "data.json")
+    legacy = DataStorage(storage_file)
+    legacy.bulk_import([make_patient(f"p-{i}") for i in range(20)],
+                       [make_assessment(f"p-{i}") for i in range(20)])
+
+    def crash(self, storage_file):
+        raise KeyboardInterrupt
+    with monkeypatch.context() as patch:
+        patch.setattr(ShardedDataStorage, "_import_unsharded", crash)
+        with pytest.raises(KeyboardInterrupt):
+            ShardedDataStorage(storage_file, shard_count=3)
+    assert not os.path.exists(str(tmp_path / "data.shards.json"))
+
+    storage = ShardedDataStorage(storage_file, shard_count=3)
+    assert len(storage.get_patients()) == 20
+    assert all(len(storage.get_patient_assessments(f"p-{i}")) == 1 for i in range(20))
+
+
+def test_cross_shard_search_scores_match_single_store(tmp_path):
+    patients = [make_patient(f"p-{i}") for i in range(12)]
+    assessments = [make_assessment(p.patient_id, "chest pain" if i % 3 else "chest tightness pain")
+                   for i, p in enumerate(patients)]
+    single = DataStorage(str(tmp_path / "single.json"))
+    single.bulk_import(patients, assessments)
+    sharded = ShardedDataStorage(str(tmp_path / "sharded.json"), shard_count=4)
+    sharded.bulk_import(patients, assessments)
+
+    for query in ("chest pain", "tightness", ""):
+        expected = {a.assessment_id: score for a, score in single.search_assessments(query, limit=50)}
+        actual = {a.assessment_id: score for a, score in sharded.search_assessments(query, limit=50)}
+        assert actual == expected
+
+
+def test_reshard_with_concurrent_writes(tmp_path):
+    storage_file = str(tmp_path / "data.json")
+    storage = ShardedDataStorage(storage_file, shard_count=2)
+    storage.bulk_import([make_patient(f"p-{i}") for i in range(60)],
+                        [make_assessment(f"p-{i}") for i in range(60)])
+    errors = []
+    stop = threading.Event()
+    written = {}
+
+    def write(worker: int):
+        count = 0
+        try:
+            while not stop.is_set() and count < 30:
+                patient_id = f"p-{(worker * 17 + count) % 80}"
+                assessment = make_assessment(patient_id, "cough")
+                if count % 2:
+                    with storage.batch():
+                        storage.add_patient(make_patient(patient_id, "writer"))
+                        storage.add_assessment(assessment)
+                else:
+                    storage.add_assessment(assessment)
+                written[assessment.assessment_id] = patient_id
+                count += 1
+        except Exception as e:
+            errors.append(e)
+
+    writers = [threading.Thread(target=write, args=(i,)) for i in range(4)]
+    for writer in writers:
+        writer.start()
+    try:
+        added = storage.add_shard()
+        storage.remove_shard("shard-0")
+    finally:
+        stop.set()
+        for writer in writers:
+            writer.join(10)
+
+    assert errors == []
+    assert written
+    assert storage.ring.nodes == sorted(["shard-1", added])
+
+    reloaded = ShardedDataStorage(storage_file)
+    for storage_view in (storage, reloaded):
+        for assessment_id, patient_id in written.items():
+            assessment = storage_view.get_assessment(assessment_id)
+            assert assessment is not None and assessment.patient_id == patient_id
+        for patient_id in {f"p-{i}" for i in range(60)} | set(written.values()):
+            assert owners(storage_view, patient_id) == [storage_view.ring.get_node(patient_id)]
+
+
+def populate_archive(storage, count=20):
+    """Give each patient an archived and an open assessment; returns the archived ones"""
+    archived = [make_assessment(f"p-{i}", "migraine", days_ago=90, processed=True) for i in range(count)]
+    storage.bulk_import([make_patient(f"p-{i}") for i in range(count)],
+                        archived + [make_assessment(f"p-{i}", "cough") for i in range(count)])
+    assert storage.archive_assessments(NOW) == count
+    return archived
+
+
+def segment_record_ids(shard: DataStorage):
+    ids = []
+    for path in glob.glob(os.path.join(shard.archive_dir, "*", "segment-*.json.gz")):
+        if not path.endswith(".index.json.gz"):
+            with gzip.open(path, "rt") as f:
+                ids.extend(record["assessment_id"] for record in json.load(f))
+    return ids
+
+
+def assert_archived_on_owners(storage, archived):
+    assert len(storage.assessments) == len(archived)
+    assert all(not a.processed_at for a in storage.assessments.values())
+    for assessment in archived:
+        owner = storage.shards[storage.ring.get_node(assessment.patient_id)]
+        assert assessment.assessment_id in owner.cold_assessments
+        assert storage.get_assessment(assessment.assessment_id).symptoms[0].name == "migraine"
+    # Every archived record is on disk exactly once, on its owner
+    on_disk = [i for shard in storage.shards.values() for i in segment_record_ids(shard)]
+    assert sorted(on_disk) == sorted(a.assessment_id for a in archived)
+    assert len(storage.search_assessments("migraine", limit=100)) == len(archived)
+
+
+def test_reshard_keeps_archived_assessments_cold(tmp_path):
+    storage_file = str(tmp_path / "data.json")
+    storage = ShardedDataStorage(storage_file, shard_count=2)
+    archived = populate_archive(storage)
+
+    storage.add_shard()
+    assert_archived_on_owners(storage, archived)
+    storage.remove_shard("shard-0")
+    assert_archived_on_owners(storage, archived)
+    assert_archived_on_owners(ShardedDataStorage(storage_file), archived)
+
+
+def test_import_keeps_archived_assessments_cold(tmp_path):
+    storage_file = str(tmp_path / "data.json")
+    archived = populate_archive(DataStorage(storage_file))
+
+    storage = ShardedDataStorage(storage_file, shard_count=3)
+    assert_archived_on_owners(storage, archived)
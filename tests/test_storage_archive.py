@@ -0,0 +1,151 @@
+import json
+import shutil
+import threading
+
+from conftest import NOW, make_assessment, make_patient
+from healthcare_assistant import DataStorage
+
+
+def populate(storage_file):
+    storage = DataStorage(storage_file, hot_retention_days=30)
+    old = [make_assessment("p-1", "migraine", days_ago=90, processed=True),
+           make_assessment("p-1", "persistent cough", days_ago=60, processed=True)]
+    recent = make_assessment("p-1", "cough", days_ago=5)
+    with storage.batch():
+        storage.add_patient(make_patient("p-1", "alice"))
+        for assessment in old + [recent]:
+            storage.add_assessment(assessment)
+    return storage, old, recent
+
+
+def test_archive_reload_lookup(tmp_path):
+    storage_file = str(tmp_path / "data.json")
+    storage, old, recent = populate(storage_file)
+    scores_before = {a.assessment_id: score for a, score in storage.search_assessments("cough")}
+
+    assert storage.archive_assessments(NOW) == 2
+    assert set(storage.assessments) == {recent.assessment_id}
+
+    reloaded = DataStorage(storage_file, hot_retention_days=30)
+    assert set(reloaded.assessments) == {recent.assessment_id}
+    assert set(reloaded.cold_assessments) == {a.assessment_id for a in old}
+    assert reloaded.get_assessment(old[0].assessment_id).symptoms[0].name == "migraine"
+    assert len(reloaded.get_patient_assessments("p-1")) == 3
+    assert [a.assessment_id for a in reloaded.get_open_assessments()] == [recent.assessment_id]
+
+    timeline = reloaded.get_patient_timeline("p-1")
+    assert timeline["assessment_count"] == 3
+    assert {o["name"] for o in timeline["symptom_occurrences"]} == {"migraine", "persistent cough", "cough"}
+
+    # Hot and archived matches are ranked together with the same scores as before
+    results = reloaded.search_assessments("cough")
+    assert {a.assessment_id: score for a, score in results} == scores_before
+    assert reloaded.search_assessments("migraine")[0][0].assessment_id == old[0].assessment_id
+
+
+def test_sidecar_only_holds_hot_tier(tmp_path):
+    storage_file = str(tmp_path / "data.json")
+    storage, old, recent = populate(storage_file)
+    storage.archive_assessments(NOW)
+
+    with open(storage.index_file) as f:
+        sidecar = json.load(f)
+    assert set(sidecar["documents"]) == {recent.assessment_id}
+    assert "timelines" not in sidecar
+
+
+def test_archive_views_load_on_demand(tmp_path, monkeypatch):
+    storage_file = str(tmp_path / "data.json")
+    storage, old, recent = populate(storage_file)
+    storage.archive_assessments(NOW)
+
+    def no_reads(self, segment):
+        raise AssertionError(f"read {segment} at startup")
+    with monkeypatch.context() as patch:
+        patch.setattr(DataStorage, "_load_segment", no_reads)
+        patch.setattr(DataStorage, "_load_segment_index", no_reads)
+        reloaded = DataStorage(storage_file, hot_retention_days=30)
+        assert sorted(reloaded.get_patient_ids()) == ["p-1"]
+
+    assert reloaded.search_assessments("migraine")[0][0].assessment_id == old[0].assessment_id
+    assert reloaded.get_patient_timeline("p-1")["assessment_count"] == 3
+
+
+def test_missing_segment_index_is_rebuilt(tmp_path):
+    storage_file = str(tmp_path / "data.json")
+    storage, old, recent = populate(storage_file)
+    storage.archive_assessments(NOW)
+    index_files = list((tmp_path / "data_archive").glob("*/*.index.json.gz"))
+    assert len(index_files) == 2
+    index_files[0].unlink()
+
+    reloaded = DataStorage(storage_file, hot_retention_days=30)
+    assert {a.assessment_id for a, _ in reloaded.search_assessments("cough")} == {
+        old[1].assessment_id, recent.assessment_id}
+    assert reloaded.search_assessments("migraine")[0][0].assessment_id == old[0].assessment_id
+    assert index_files[0].exists()
+
+
+def test_updating_archived_assessment_brings_it_back(tmp_path):
+    storage_file = str(tmp_path / "data.json")
+    storage, old, recent = populate(storage_file)
+    storage.archive_assessments(NOW)
+
+    updated = storage.get_assessment(old[0].assessment_id)
+    updated.doctor_notes = "follow-up booked"
+    storage.add_assessment(updated)
+
+    reloaded = DataStorage(storage_file, hot_retention_days=30)
+    assert old[0].assessment_id in reloaded.assessments
+    assert old[0].assessment_id not in reloaded.cold_assessments
+    assert reloaded.get_patient_timeline("p-1")["assessment_count"] == 3
+    assert [a.assessment_id for a, _ in reloaded.search_assessments("migraine")] == [old[0].assessment_id]
+
+
+def test_interrupted_archival_keeps_hot_copy(tmp_path):
+    storage_file = str(tmp_path / "data.json")
+    storage, old, recent = populate(storage_file)
+    shutil.copy(storage_file, str(tmp_path / "before.json"))
+    shutil.copy(storage.index_file, str(tmp_path / "before.index.json"))
+    storage.archive_assessments(NOW)
+    # Crash after the manifest was written but before the data file was
+    shutil.copy(str(tmp_path / "before.json"), storage_file)
+    shutil.copy(str(tmp_path / "before.index.json"), storage.index_file)
+
+    reloaded = DataStorage(storage_file, hot_retention_days=30)
+    assert len(reloaded.assessments) == 3
+    assert reloaded.cold_assessments == {}
+    assert reloaded.get_patient_timeline("p-1")["assessment_count"] == 3
+    assert len(reloaded.search_assessments("cough")) == 2
+
+
+def test_reads_during_archival(tmp_path):
+    storage = DataStorage(str(tmp_path / "data.json"), hot_retention_days=30)
+    storage.add_patient(make_patient("p-1", "alice"))
+    storage.bulk_import(assessments=[make_assessment("p-1", "cough", days_ago=60 + i, processed=True)
+                                     for i in range(300)])
+    errors = []
+    done = threading.Event()
+
+    def read():
+        while not done.is_set():
+            try:
+                storage.get_open_assessments()
+                storage.get_patient_assessments("p-1")
+                storage.search_assessments("cough", limit=5)
+            except Exception as e:
+                errors.append(e)
+                return
+
+    readers = [threading.Thread(target=read) for _ in range(3)]
+    for reader in readers:
+        reader.start()
+    try:
+        assert storage.archive_assessments(NOW) == 300
+    finally:
+        done.set()
+        for reader in readers:
+            reader.join(5)
+
+    assert errors == []
+    assert len(storage.get_patient_assessments("p-1")) == 300
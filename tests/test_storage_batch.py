@@ -0,0 +1,114 @@
+import json
+import os
+import stat
+import threading
+
+import pytest
+
+from conftest import make_assessment, make_patient
+from healthcare_assistant import DataStorage
+
+
+def stored_ids(storage_file: str):
+    with open(storage_file) as f:
+        data = json.load(f)
+    return ({p["patient_id"] for p in data["patients"]},
+            {a["assessment_id"] for a in data["assessments"]})
+
+
+@pytest.fixture
+def storage_file(tmp_path):
+    return str(tmp_path / "data.json")
+
+
+def test_batch_writes_once_on_commit(storage_file, monkeypatch):
+    storage = DataStorage(storage_file)
+    saves = []
+    monkeypatch.setattr(storage, "save_data", lambda: saves.append(1))
+
+    with storage.batch():
+        patient = make_patient("p-alice")
+        storage.add_patient(patient)
+        with storage.batch():
+            storage.add_assessment(make_assessment(patient.patient_id))
+        assert saves == []
+
+    assert saves == [1]
+
+
+def test_batch_commit_is_durable(storage_file):
+    storage = DataStorage(storage_file)
+    patient = make_patient("p-alice")
+    assessment = make_assessment(patient.patient_id)
+    with storage.batch():
+        storage.add_patient(patient)
+        storage.add_assessment(assessment)
+
+    assert stored_ids(storage_file) == ({patient.patient_id}, {assessment.assessment_id})
+    reloaded = DataStorage(storage_file)
+    assert reloaded.get_assessment(assessment.assessment_id).symptoms[0].name == "headache"
+    assert reloaded.search_assessments("headache")[0][0].assessment_id == assessment.assessment_id
+
+
+def test_batch_rollback_restores_state(storage_file):
+    storage = DataStorage(storage_file)
+    kept = make_patient("p-kept")
+    kept_assessment = make_assessment(kept.patient_id, "cough")
+    storage.add_patient(kept)
+    storage.add_assessment(kept_assessment)
+
+    with pytest.raises(RuntimeError):
+        with storage.batch():
+            storage.add_patient(make_patient("p-dropped"))
+            storage.add_assessment(make_assessment("p-dropped", "fever"))
+            storage.remove_patient(kept.patient_id)
+            raise RuntimeError("boom")
+
+    assert set(storage.patients) == {kept.patient_id}
+    assert set(storage.assessments) == {kept_assessment.assessment_id}
+    assert storage.search_assessments("fever") == []
+    assert storage.get_patient_timeline(kept.patient_id)["assessment_count"] == 1
+    assert stored_ids(storage_file) == ({kept.patient_id}, {kept_assessment.assessment_id})
+
+    # The storage is usable again after the rollback
+    storage.add_patient(make_patient("p-after"))
+    assert "p-after" in stored_ids(storage_file)[0]
+
+
+def test_other_threads_wait_for_batch(storage_file):
+    storage = DataStorage(storage_file)
+    inside = threading.Event()
+    writer_done = threading.Event()
+
+    def write_from_other_thread():
+        inside.wait()
+        storage.add_patient(make_patient("p-other"))
+        writer_done.set()
+
+    thread = threading.Thread(target=write_from_other_thread)
+    thread.start()
+    with pytest.raises(RuntimeError):
+        with storage.batch():
+            storage.add_patient(make_patient("p-dropped"))
+            inside.set()
+            # The other thread's write blocks until the batch is over
+            assert not writer_done.wait(0.2)
+            raise RuntimeError("boom")
+    thread.join(5)
+
+    assert set(storage.patients) == {"p-other"}
+    assert stored_ids(storage_file)[0] == {"p-other"}
+
+
+def test_atomic_write_keeps_file_mode(storage_file):
+    previous_umask = os.umask(0o027)
+    try:
+        storage = DataStorage(storage_file)
+        storage.add_patient(make_patient("p-alice"))
+    finally:
+        os.umask(previous_umask)
+    assert stat.S_IMODE(os.stat(storage_file).st_mode) == 0o640
+
+    os.chmod(storage_file, 0o604)
+    storage.add_patient(make_patient("p-bob"))
+    assert stat.S_IMODE(os.stat(storage_file).st_mode) == 0o604